@@ -0,0 +1,263 @@
+"""
+Matchmaking benchmark and quality-regression suite.
+
+Builds seeded synthetic rosters shaped like the ones /sangmatch passes to
+the engines, runs each engine from N=1 up to N=10,000 and reports wall
+time, peak memory, stranded players, hard-constraint violations and
+balance metrics. Results are compared with bench_baseline.json and the
+script exits non-zero when any of them regress. It then churns a few
+raiders on greedy teams and checks that `repair_teams` leaves every team
+it didn't need to touch with its exact membership.
+
+    python bench_matchmaking.py                    # run and compare
+    python bench_matchmaking.py --quick            # sizes up to 1,000 only
+    python bench_matchmaking.py --update-baseline  # accept the current results
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+import sanguine_sunday_bot as sb
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+ENGINES = ("greedy", "optimized")
+SIZES = list(range(1, 41)) + [50, 75, 100, 150, 200, 300, 500, 750, 1000, 2000, 5000, 10000]
+QUICK_MAX = 1000
+
+# Share of each proficiency in a roster, plus per-player flag rates
+DEFAULT_MIX = {"mentor": 0.08, "highly proficient": 0.25, "proficient": 0.27, "learner": 0.2, "new": 0.2}
+DEFAULT_RATES = {"scythe": 0.4, "freeze": 0.1, "mentee": 0.15}
+KC_RANGES = {"highly proficient": (101, 600), "proficient": (26, 100), "learner": (11, 25), "new": (0, 10)}
+
+REPAIR_CHURN = (1, 5) # Raiders who leave, and as many who join, per repair check
+
+HARD_METRICS = ("stranded", "violations")
+BALANCE_METRICS = ("no_strong", "lonely_mentees", "weak_spread", "scythe_spread")
+
+# ---------------------------
+# 🔹 Synthetic Rosters
+# ---------------------------
+
+def generate_roster(n: int, seed: int = 0, mix: Dict[str, float] = DEFAULT_MIX,
+                    rates: Dict[str, float] = DEFAULT_RATES) -> List[Dict[str, Any]]:
+    """Returns n raider dicts in the shape /sangmatch builds. Same (n, seed, mix, rates) → same roster."""
+    rng = random.Random(f"{seed}:{n}")
+    roles, weights = zip(*mix.items())
+    roster = []
+    for i in range(n):
+        role = rng.choices(roles, weights)[0]
+        kc = 9999 if role == "mentor" else rng.randint(*KC_RANGES[role])
+        roster.append({
+            "user_id": str(100000000000000000 + i),
+            "user_name": f"Raider{i}",
+            "proficiency": role,
+            "kc": kc,
+            "has_scythe": rng.random() < rates["scythe"],
+            "roles_known": "Range, Melee",
+            "learning_freeze": rng.random() < rates["freeze"],
+            "knows_range": True,
+            "knows_melee": True,
+            "wants_mentor": role != "mentor" and rng.random() < rates["mentee"],
+        })
+    return roster
+
+# ---------------------------
+# 🔹 Quality Metrics
+# ---------------------------
+
+def team_violations(team: List[Dict[str, Any]]) -> int:
+    """Counts the hard constraints a team breaks (the same rules `can_add` enforces)."""
+    roles = [sb.normalize_role(p) for p in team]
+    broken = 0
+    if len(team) > 5:
+        broken += 1
+    if sum(bool(p.get("learning_freeze")) for p in team) > 1:
+        broken += 1
+    if len(team) == 5 and "new" in roles:
+        broken += 1
+    if len(team) == 3 and not all(sb.is_proficient_plus(p) for p in team):
+        broken += 1
+    return broken
+
+def score(roster: List[Dict[str, Any]], teams: List[List[Dict[str, Any]]], stranded: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Hard and balance metrics for one run. Lower is better for every value."""
+    placed = sum(len(t) for t in teams) + len(stranded)
+    if placed != len(roster):
+        raise AssertionError(f"engine returned {placed} players for a roster of {len(roster)}")
+    weak = [sum(sb.normalize_role(p) in ("new", "learner") for p in t) for t in teams] or [0]
+    scythes = [sum(bool(p.get("has_scythe")) for p in t) for t in teams] or [0]
+    lonely = 0
+    for t in teams:
+        if not any(sb.normalize_role(p) == "mentor" for p in t):
+            lonely += sum(bool(p.get("wants_mentor")) for p in t)
+    return {
+        "stranded": len(stranded),
+        "violations": sum(team_violations(t) for t in teams),
+        "no_strong": sum(not any(sb.is_proficient_plus(p) for p in t) for t in teams),
+        "lonely_mentees": lonely,
+        "weak_spread": max(weak) - min(weak),
+        "scythe_spread": max(scythes) - min(scythes),
+    }
+
+# ---------------------------
+# 🔹 Runner
+# ---------------------------
+
+def run_case(engine: str, n: int, seed: int) -> Dict[str, Any]:
+    """Runs one engine on one roster. Timing and the traced memory run are separate so tracing doesn't skew the time."""
+    roster = generate_roster(n, seed)
+    sb._match_cache.clear() # Measure the engine, not the roster-hash memo
+    start = time.perf_counter()
+    teams, stranded, params = sb.run_matchmaking([dict(p) for p in roster], engine)
+    elapsed = time.perf_counter() - start
+
+    fresh = [dict(p) for p in roster]
+    sb._match_cache.clear()
+    # Tracing slows the search several times over; lift the time cap so only max_iterations
+    # bounds this pass and the peak covers the same work as the timed run
+    budget, sb.MATCH_BUDGET_MS = sb.MATCH_BUDGET_MS, 10 ** 9
+    tracemalloc.start()
+    try:
+        sb.run_matchmaking(fresh, engine)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        sb.MATCH_BUDGET_MS = budget
+
+    result = {"time_ms": round(elapsed * 1000, 2), "peak_kb": round(peak / 1024, 1), "teams": len(teams),
+              "time_capped": bool(params.get("time_capped"))}
+    result.update(score(roster, teams, stranded))
+    return result
+
+def repair_case(n: int, churn: int, seed: int) -> Dict[str, Any]:
+    """
+    Seats a roster with the greedy engine, swaps `churn` raiders for as many
+    joiners and repairs. `broken` counts teams that changed beyond the
+    players repair_teams reports as moved, or that lost their order.
+    """
+    roster = generate_roster(n + churn, seed)
+    previous, _ = sb.matchmaking_algorithm([dict(p) for p in roster[:n]])
+    rng = random.Random(f"repair:{seed}:{n}")
+    leavers = {p["user_id"] for p in rng.sample(roster[:n], min(churn, n))}
+    available = [dict(p) for p in roster if p["user_id"] not in leavers]
+
+    start = time.perf_counter()
+    teams, stranded, moved = sb.repair_teams(previous, available)
+    elapsed = time.perf_counter() - start
+
+    after = {p["user_id"]: [q["user_id"] for q in team] for team in teams for p in team}
+    changed = broken = 0
+    for team in previous:
+        ids = [p["user_id"] for p in team]
+        if any(uid in leavers for uid in ids):
+            continue
+        anchor = next((uid for uid in ids if uid not in moved), None) # Someone still on the team
+        now = after.get(anchor) or []
+        if now == ids:
+            continue
+        changed += 1
+        kept = [uid for uid in now if uid in ids]
+        if (set(now) ^ set(ids)) - moved or kept != [uid for uid in ids if uid in kept]:
+            broken += 1
+    return {"time_ms": round(elapsed * 1000, 2), "moved": len(moved), "changed": changed, "broken": broken,
+            "stranded": len(stranded), "placed": sum(len(t) for t in teams) + len(stranded) == len(available)}
+
+def compare(engine: str, n: int, current: Dict[str, Any], base: Dict[str, Any], args) -> List[str]:
+    """Returns a description of every metric that regressed against the baseline."""
+    problems = []
+    for metric in HARD_METRICS:
+        if current[metric] > base[metric]:
+            problems.append(f"{metric} {base[metric]} → {current[metric]}")
+    for metric in BALANCE_METRICS:
+        # The optimized engine falls back to its time cap on slow machines, so allow a little slack
+        allowed = base[metric] + max(1, math.ceil(base[metric] * args.quality_slack)) if engine == "optimized" else base[metric]
+        if current[metric] > allowed:
+            problems.append(f"{metric} {base[metric]} → {current[metric]}")
+    if current["time_ms"] > base["time_ms"] * args.time_tolerance and current["time_ms"] - base["time_ms"] > args.noise_ms:
+        problems.append(f"time {base['time_ms']}ms → {current['time_ms']}ms")
+    if current["peak_kb"] > base["peak_kb"] * args.memory_tolerance and current["peak_kb"] - base["peak_kb"] > args.noise_kb:
+        problems.append(f"peak memory {base['peak_kb']}KB → {current['peak_kb']}KB")
+    return [f"{engine} N={n}: {p}" for p in problems]
+
+def load_baseline() -> Dict[str, Any]:
+    try:
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the matchmaking engines and check for regressions.")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--sizes", nargs="+", type=int, help="Roster sizes to run (default: 1-40 and up to 10,000)")
+    parser.add_argument("--quick", action="store_true", help=f"Only run sizes up to {QUICK_MAX}")
+    parser.add_argument("--seed", type=int, default=0, help="Roster generator seed")
+    parser.add_argument("--update-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=3.0, help="Allowed slowdown factor")
+    parser.add_argument("--memory-tolerance", type=float, default=1.5, help="Allowed peak memory growth factor")
+    parser.add_argument("--quality-slack", type=float, default=0.1, help="Allowed balance drift for the optimized engine")
+    parser.add_argument("--noise-ms", type=float, default=50.0, help="Time differences below this are ignored")
+    parser.add_argument("--noise-kb", type=float, default=256.0, help="Memory differences below this are ignored")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or [n for n in SIZES if not args.quick or n <= QUICK_MAX]
+    config = {"seed": args.seed, "mix": DEFAULT_MIX, "rates": DEFAULT_RATES, "budget_ms": sb.MATCH_BUDGET_MS}
+    baseline = load_baseline()
+    comparable = baseline.get("config") == config
+    if baseline and not comparable and not args.update_baseline:
+        print("⚠️ Baseline was recorded with a different generator config or budget; not comparing.")
+
+    header = f"{'engine':<10}{'N':>7}{'time ms':>10}{'peak KB':>10}{'teams':>7}{'strand':>8}{'viol':>6}{'noStr':>7}{'lonely':>8}{'weakΔ':>7}{'scyΔ':>6}"
+    print(header)
+    results: Dict[str, Dict[str, Any]] = {engine: {} for engine in args.engines}
+    regressions: List[str] = []
+    for engine in args.engines:
+        for n in sizes:
+            r = run_case(engine, n, args.seed)
+            results[engine][str(n)] = r
+            print(f"{engine:<10}{n:>7}{r['time_ms']:>10.2f}{r['peak_kb']:>10.1f}{r['teams']:>7}{r['stranded']:>8}"
+                  f"{r['violations']:>6}{r['no_strong']:>7}{r['lonely_mentees']:>8}{r['weak_spread']:>7}{r['scythe_spread']:>6}")
+            if r["time_capped"]:
+                print(f"⚠️ {engine} N={n} hit the {sb.MATCH_BUDGET_MS}ms cap; its balance metrics depend on this machine's speed.")
+            base = baseline.get("results", {}).get(engine, {}).get(str(n)) if comparable else None
+            if base:
+                regressions.extend(compare(engine, n, r, base, args))
+
+    print(f"\n{'repair':<10}{'N':>7}{'churn':>7}{'time ms':>10}{'moved':>7}{'changed':>9}{'broken':>8}")
+    for n in sizes:
+        for churn in REPAIR_CHURN:
+            if churn >= n:
+                continue
+            r = repair_case(n, churn, args.seed)
+            print(f"{'repair':<10}{n:>7}{churn:>7}{r['time_ms']:>10.2f}{r['moved']:>7}{r['changed']:>9}{r['broken']:>8}")
+            if r["broken"]:
+                regressions.append(f"repair N={n} churn={churn}: {r['broken']} team(s) changed beyond the moved players")
+            if not r["placed"]:
+                regressions.append(f"repair N={n} churn={churn}: players lost or duplicated")
+
+    if args.update_baseline:
+        merged = baseline.get("results", {}) if comparable else {}
+        for engine, by_size in results.items():
+            merged.setdefault(engine, {}).update(by_size)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": merged}, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"✅ Baseline written to {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print(f"\n🔥 {len(regressions)} regression(s) against the baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\n✅ No regressions against the baseline." if comparable else "\n⚠️ No baseline to compare against (run with --update-baseline).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
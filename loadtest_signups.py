@@ -0,0 +1,507 @@
+"""
+Signup surge load test against an in-memory Google Sheets stand-in.
+
+Replays a Friday-style burst of clicks through the real handlers
+(SignupView's Raider/Mentor buttons, UserSignupForm.on_submit,
+MentorSignupForm.on_submit and WithdrawalButton.callback) with hundreds of
+simulated users at once, while the cog's replicator mirrors the local
+store to the sheet in the background. Discord is replaced by a stub that
+records every response, and both tabs by FakeWorksheet, which can add
+latency and inject API errors.
+
+Reports time to first response (p50/p99/max) against the 3s deadline,
+deadline misses, lost writes and duplicate sheet rows, and exits non-zero
+when any interaction missed the deadline or a write was lost or duplicated.
+
+    python loadtest_signups.py                                 # 300 users over 10s
+    python loadtest_signups.py --users 800 --ramp 5            # a harder surge
+    python loadtest_signups.py --sheets-ms 800 --error-rate 0.05 --landed-error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import discord
+import gspread
+import requests
+from discord.webhook.async_ import async_context
+
+import sanguine_sunday_bot as sb
+
+FIRST_USER_ID = 300000000000000000
+RESPONSE_KINDS = {4: "message", 5: "deferred", 6: "deferred_update", 7: "update", 9: "modal"}
+
+# ---------------------------
+# 🔹 In-memory Worksheet
+# ---------------------------
+
+def api_error(status: int) -> gspread.exceptions.APIError:
+    """A real gspread APIError carrying `status`, as the Sheets API would raise it."""
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps({"error": {"code": status, "message": "Injected by loadtest", "status": "INJECTED"}}).encode()
+    return gspread.exceptions.APIError(response)
+
+class FakeSpreadsheet:
+    """The Spreadsheet surface the cog touches: batch_update with deleteDimension requests."""
+    def __init__(self, worksheet: "FakeWorksheet"):
+        self.worksheet = worksheet
+
+    def batch_update(self, body: Dict[str, Any]):
+        def apply():
+            for request in body["requests"]:
+                r = request["deleteDimension"]["range"]
+                del self.worksheet.rows[r["startIndex"]:r["endIndex"]]
+            return {"replies": [{} for _ in body["requests"]]}
+        return self.worksheet._request("spreadsheet.batch_update", apply)
+
+class FakeWorksheet:
+    """
+    In-memory stand-in for the gspread Worksheet methods the cog calls.
+    Values are stored the way the API returns them ("TRUE"/"FALSE",
+    numbers as text). Every request sleeps `latency_ms` plus up to
+    `jitter_ms` on the calling thread, then fails with a retryable status
+    at `error_rate` before touching the data, or at `landed_error_rate`
+    after it was applied (a timeout whose write still landed).
+    """
+    def __init__(self, title: str, rows: Optional[List[list]] = None, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, landed_error_rate: float = 0.0, seed: int = 0):
+        self.title = title
+        self.id = abs(hash(title)) % 100000
+        self.rows: List[List[str]] = [self._cells(r) for r in rows or []]
+        self.spreadsheet = FakeSpreadsheet(self)
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.error_rate, self.landed_error_rate = error_rate, landed_error_rate
+        self.calls: Dict[str, int] = {}
+        self.injected = 0
+        self._rng = random.Random(f"{seed}:{title}")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cells(values: list) -> List[str]:
+        return [("TRUE" if v else "FALSE") if isinstance(v, bool) else ("" if v is None else str(v)) for v in values]
+
+    def _request(self, name: str, apply):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            delay = (self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000
+            roll = self._rng.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.error_rate:
+            self.injected += 1
+            raise api_error(self._rng.choice((429, 503)))
+        with self._lock:
+            result = apply()
+        if roll < self.error_rate + self.landed_error_rate:
+            self.injected += 1
+            raise api_error(500)
+        return result
+
+    def _append(self, values: List[list]) -> Dict[str, Any]:
+        first = len(self.rows) + 1
+        self.rows.extend(self._cells(v) for v in values)
+        return {"updates": {"updatedRange": f"{self.title}!A{first}:I{len(self.rows)}", "updatedRows": len(values)}}
+
+    def _set_row(self, a1_range: str, values: list):
+        row = sb.first_row_of(f"{self.title}!{a1_range}")
+        while len(self.rows) < row:
+            self.rows.append([])
+        self.rows[row - 1] = self._cells(values)
+
+    def find(self, query: str, in_column: Optional[int] = None, in_row: Optional[int] = None, case_sensitive: bool = True):
+        def apply():
+            for r, row in enumerate(self.rows, start=1):
+                for c, value in enumerate(row, start=1):
+                    if (in_column is None or c == in_column) and (in_row is None or r == in_row) and value == str(query):
+                        return gspread.cell.Cell(r, c, value)
+            return None
+        return self._request("find", apply)
+
+    def append_row(self, values: list, **kwargs) -> Dict[str, Any]:
+        return self._request("append_row", lambda: self._append([values]))
+
+    def append_rows(self, values: List[list], **kwargs) -> Dict[str, Any]:
+        return self._request("append_rows", lambda: self._append(values))
+
+    def update(self, values: Optional[List[list]] = None, range_name: Optional[str] = None, **kwargs):
+        return self._request("update", lambda: self._set_row(range_name, values[0]))
+
+    def batch_update(self, data: List[Dict[str, Any]], **kwargs):
+        def apply():
+            for d in data:
+                self._set_row(d["range"], d["values"][0])
+        return self._request("batch_update", apply)
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None):
+        def apply():
+            del self.rows[start_index - 1:(end_index or start_index)]
+        return self._request("delete_rows", apply)
+
+    def get_all_records(self, **kwargs) -> List[Dict[str, Any]]:
+        def apply():
+            if not self.rows:
+                return []
+            header = self.rows[0]
+            return [dict(zip(header, gspread.utils.numericise_all(row + [""] * (len(header) - len(row)))))
+                    for row in self.rows[1:] if any(row)]
+        return self._request("get_all_records", apply)
+
+    def row_values(self, row: int, **kwargs) -> list:
+        return self._request("row_values", lambda: list(self.rows[row - 1]) if row <= len(self.rows) else [])
+
+    def col_values(self, col: int, **kwargs) -> list:
+        def apply():
+            values = [row[col - 1] if len(row) >= col else "" for row in self.rows]
+            while values and values[-1] == "":
+                values.pop()
+            return values
+        return self._request("col_values", apply)
+
+    def batch_get(self, ranges: List[str], **kwargs) -> list:
+        def apply():
+            out = []
+            for a1 in ranges:
+                row = sb.first_row_of(f"{self.title}!{a1}")
+                value = self.rows[row - 1][0] if row <= len(self.rows) and self.rows[row - 1] else ""
+                out.append([[value]] if value else [])
+            return out
+        return self._request("batch_get", apply)
+
+    def clear(self):
+        def apply():
+            self.rows = []
+        return self._request("clear", apply)
+
+    def ids(self) -> List[str]:
+        """Discord IDs in sheet order (header excluded)."""
+        with self._lock:
+            return [row[0] for row in self.rows[1:] if row and row[0]]
+
+    def row_for(self, user_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            for row in self.rows[1:]:
+                if row and row[0] == user_id:
+                    return dict(zip(sb.SANG_SHEET_HEADER, row))
+        return None
+
+# ---------------------------
+# 🔹 Discord Stand-in
+# ---------------------------
+
+class FakeDiscord:
+    """
+    Replaces discord.py's webhook adapter: every interaction response and
+    followup is recorded with the interaction's age when Discord got it.
+    """
+    def __init__(self, latency_ms: float, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.replies: Dict[int, List[tuple]] = {} # interaction id -> [(age, kind, content)]
+        self.modal_ids: Dict[int, str] = {}       # interaction id -> custom_id of the modal it opened
+        self._rng = random.Random(seed)
+
+    async def _round_trip(self):
+        if self.latency_ms:
+            await asyncio.sleep(self._rng.uniform(0.5, 1.5) * self.latency_ms / 1000)
+
+    def record(self, interaction_id: int, kind: str, content: Optional[str]):
+        age = (discord.utils.utcnow() - discord.utils.snowflake_time(interaction_id)).total_seconds()
+        self.replies.setdefault(interaction_id, []).append((age, kind, content or ""))
+
+    async def create_interaction_response(self, interaction_id: int, token: str, *, session, proxy=None, proxy_auth=None, params):
+        await self._round_trip()
+        payload = params.payload
+        data = payload.get("data") or {}
+        kind = RESPONSE_KINDS.get(payload["type"], str(payload["type"]))
+        if kind == "modal":
+            self.modal_ids[interaction_id] = data["custom_id"]
+        self.record(interaction_id, kind, data.get("content"))
+        return {"interaction": {"id": str(interaction_id), "type": payload["type"]}}
+
+class FakeFollowup:
+    """An interaction's followup webhook; sends are recorded instead of delivered."""
+    def __init__(self, discord_stub: FakeDiscord, interaction_id: int):
+        self.discord, self.interaction_id = discord_stub, interaction_id
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await self.discord._round_trip()
+        self.discord.record(self.interaction_id, "followup", content)
+
+class FakeGuild:
+    """Answers `guild.get_member` for the simulated users."""
+    def __init__(self):
+        self.members: Dict[int, SimpleNamespace] = {}
+
+    def get_member(self, user_id: int):
+        return self.members.get(user_id)
+
+class FakeState:
+    """The slice of discord.py's ConnectionState an Interaction and its responses touch."""
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+        self.http = SimpleNamespace(proxy=None, proxy_auth=None, token=None, _HTTPClient__session=None)
+        self.allowed_mentions = None
+        self.modals: Dict[str, discord.ui.Modal] = {}
+
+    def _get_client(self):
+        return None
+
+    def _get_guild(self, guild_id):
+        return self.guild
+
+    def store_view(self, view, message_id: Optional[int] = None, interaction_id: Optional[int] = None):
+        if isinstance(view, discord.ui.Modal):
+            self.modals[view.custom_id] = view
+
+# ---------------------------
+# 🔹 Simulated Users
+# ---------------------------
+
+class Surge:
+    """One load-test run: the cog under test, the stubs, and what each user was told."""
+    def __init__(self, cog: sb.SanguineCog, discord_stub: FakeDiscord, state: FakeState):
+        self.cog, self.discord, self.state = cog, discord_stub, state
+        self.view = sb.SignupView(cog)
+        self.withdraw_button = next(c for c in self.view.children if getattr(c, "custom_id", None) == "sang_withdraw")
+        self.interactions: Dict[int, str] = {} # interaction id -> handler label
+        self.confirmed: Dict[str, Optional[str]] = {} # user id -> KC of the last confirmed signup, None once withdrawn
+        self.errors: List[str] = []
+        self._seq = 0
+
+    def interaction(self, user: Dict[str, Any], itype: int, data: Dict[str, Any], label: str) -> discord.Interaction:
+        self._seq = (self._seq + 1) % (1 << 22)
+        iid = discord.utils.time_snowflake(discord.utils.utcnow()) | self._seq
+        payload = {
+            "id": str(iid), "type": itype, "application_id": "1", "token": f"token-{iid}", "version": 1,
+            "attachment_size_limit": 8388608, "data": data,
+            "user": {"id": str(user["id"]), "username": user["name"].lower(), "discriminator": "0", "avatar": None, "global_name": user["name"]},
+        }
+        interaction = discord.Interaction(data=payload, state=self.state)
+        interaction._cs_followup = FakeFollowup(self.discord, iid)
+        self.interactions[iid] = label
+        return interaction
+
+    def told(self, interaction: discord.Interaction) -> str:
+        """The last thing the user saw for this interaction."""
+        replies = self.discord.replies.get(interaction.id, [])
+        return replies[-1][2] if replies else ""
+
+    async def run_handler(self, coro, label: str):
+        try:
+            await coro
+        except Exception as e:
+            self.errors.append(f"{label}: {type(e).__name__}: {e}")
+
+    async def submit(self, user: Dict[str, Any], opener: discord.Interaction, values: Dict[str, str], think: float):
+        """Fills in and submits the modal `opener` was answered with."""
+        custom_id = self.discord.modal_ids.get(opener.id)
+        modal = self.state.modals.pop(custom_id, None) if custom_id else None
+        if modal is None:
+            return
+        await asyncio.sleep(think)
+        fields = {attr: getattr(modal, attr) for attr in values}
+        components = [{"type": 1, "components": [{"type": 4, "custom_id": item.custom_id, "value": values[attr]}]}
+                      for attr, item in fields.items()]
+        label = f"{type(modal).__name__}.on_submit"
+        submitted = self.interaction(user, 5, {"custom_id": modal.custom_id, "components": components}, label)
+        await self.run_handler(modal._dispatch_submit(submitted, components, {}), label)
+        if self.told(submitted).startswith("✅"):
+            self.confirmed[str(user["id"])] = values["kc"]
+
+    async def sign_up(self, user: Dict[str, Any], kc: int, think: float, rng: random.Random):
+        button = self.view.mentor_signup_button if user["mentor"] else self.view.user_signup_button
+        label = f"SignupView.{'mentor' if user['mentor'] else 'user'}_signup_button"
+        click = self.interaction(user, 3, {"custom_id": button.custom_id, "component_type": 2}, label)
+        await self.run_handler(button.callback(click), label)
+        if self.told(click).startswith("✅"): # Mentor auto-signup answers without a modal
+            self.confirmed[str(user["id"])] = "X"
+            return
+        values = {"roles_known": "All", "kc": str(kc), "has_scythe": rng.choice(("Yes", "No"))}
+        if isinstance(self.state.modals.get(self.discord.modal_ids.get(click.id, "")), sb.UserSignupForm):
+            values["learning_freeze"] = rng.choice(("", "Yes"))
+        await self.submit(user, click, values, think)
+
+    async def withdraw(self, user: Dict[str, Any]):
+        label = "WithdrawalButton.callback"
+        click = self.interaction(user, 3, {"custom_id": self.withdraw_button.custom_id, "component_type": 2}, label)
+        await self.run_handler(self.withdraw_button.callback(click), label)
+        if self.told(click).startswith("✅"):
+            self.confirmed[str(user["id"])] = None
+
+    async def user_session(self, user: Dict[str, Any], args, rng: random.Random):
+        await asyncio.sleep(rng.uniform(0, args.ramp))
+        think = lambda: rng.uniform(args.think_min, args.think_max)
+        await self.sign_up(user, user["kc"], think(), rng)
+        if rng.random() < args.resubmit_share:
+            await asyncio.sleep(think())
+            await self.sign_up(user, user["kc"] + rng.randint(1, 20), think(), rng)
+        if rng.random() < args.withdraw_share:
+            await asyncio.sleep(think())
+            await self.withdraw(user)
+
+def make_users(n: int, seed: int, mentor_share: float, guild: FakeGuild) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    users = []
+    for i in range(n):
+        mentor = rng.random() < mentor_share
+        user = {"id": FIRST_USER_ID + i, "name": f"Raider{i}", "mentor": mentor,
+                "kc": rng.randint(150, 900) if mentor else rng.randint(0, 400)}
+        roles = [SimpleNamespace(id=sb.MENTOR_ROLE_ID)] if mentor and rng.random() < 0.5 else []
+        guild.members[user["id"]] = SimpleNamespace(id=user["id"], display_name=user["name"], roles=roles)
+        users.append(user)
+    return users
+
+# ---------------------------
+# 🔹 Runner
+# ---------------------------
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def replicate_forever(cog: sb.SanguineCog, seconds: float):
+    """What scheduled_replicate and scheduled_compact_withdrawals do, on a shorter clock."""
+    while True:
+        await asyncio.sleep(seconds)
+        await cog.replicate_to_sheets()
+        await cog.compact_withdrawals()
+
+async def drain(cog: sb.SanguineCog, rounds: int = 60) -> bool:
+    """Replicates and compacts until the outbox is empty. Returns False if it never emptied."""
+    for _ in range(rounds):
+        await cog.replicate_to_sheets()
+        await cog.compact_withdrawals()
+        if not any(cog.store.pending_changes(tab) for tab in sb.STORE_TABLES):
+            return True
+        await asyncio.sleep(0.5)
+    return False
+
+def check_sheets(surge: Surge, signups: FakeWorksheet, history: FakeWorksheet) -> Dict[str, List[str]]:
+    """Compares both tabs with what users were told: lost writes, duplicate rows and withdrawn users still listed."""
+    problems: Dict[str, List[str]] = {"lost": [], "duplicates": [], "ghosts": []}
+    for tab in (signups, history):
+        seen: Dict[str, int] = {}
+        for user_id in tab.ids():
+            seen[user_id] = seen.get(user_id, 0) + 1
+        problems["duplicates"] += [f"{tab.title}: {uid} x{n}" for uid, n in seen.items() if n > 1]
+    for user_id, kc in surge.confirmed.items():
+        if kc is None:
+            if signups.row_for(user_id):
+                problems["ghosts"].append(f"{signups.title}: {user_id} withdrew but is still listed")
+            continue
+        for tab in (signups, history):
+            row = tab.row_for(user_id)
+            if row is None:
+                problems["lost"].append(f"{tab.title}: {user_id} missing")
+            elif str(row["KC"]) != kc:
+                problems["lost"].append(f"{tab.title}: {user_id} has KC {row['KC']}, was told {kc}")
+    return problems
+
+async def run(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="sang-loadtest-")
+    os.environ["SANG_DB_PATH"] = os.path.join(workdir, "loadtest.db")
+    guild = FakeGuild()
+    state = FakeState(guild)
+    stub = FakeDiscord(args.discord_ms, args.seed)
+    async_context.set(stub)
+    users = make_users(args.users, args.seed, args.mentor_share, guild)
+
+    sheet_kwargs = dict(latency_ms=args.sheets_ms, jitter_ms=args.sheets_jitter_ms, error_rate=args.error_rate,
+                        landed_error_rate=args.landed_error_rate, seed=args.seed)
+    # Returning raiders have History, so their forms open pre-filled
+    returning = [[str(u["id"]), u["name"], "All", u["kc"], False, "Proficient", False, False, "2024-01-01 00:00:00"]
+                 for u in users[:int(len(users) * args.returning_share)]]
+    signups = FakeWorksheet(sb.SANG_SHEET_TAB_NAME, [sb.SANG_SHEET_HEADER], **sheet_kwargs)
+    history = FakeWorksheet(sb.SANG_HISTORY_TAB_NAME, [sb.SANG_SHEET_HEADER] + returning, **sheet_kwargs)
+
+    cog = sb.SanguineCog(SimpleNamespace(add_view=lambda view: None))
+    cog.sang_sheet, cog.history_sheet = signups, history
+    cog.sheets_ready.set()
+    if args.cold:
+        await cog.import_from_sheets()
+    else:
+        await cog.prewarm("signup")
+
+    surge = Surge(cog, stub, state)
+    rng = random.Random(args.seed)
+    replicator = asyncio.create_task(replicate_forever(cog, args.flush_seconds))
+    start = time.perf_counter()
+    await asyncio.gather(*(surge.user_session(u, args, random.Random(rng.random())) for u in users))
+    surge_seconds = time.perf_counter() - start
+    replicator.cancel()
+    drained = await drain(cog)
+
+    # --- Report ---
+    by_label: Dict[str, List[float]] = {}
+    deferred: Dict[str, int] = {}
+    unanswered = []
+    for iid, label in surge.interactions.items():
+        replies = stub.replies.get(iid)
+        if not replies:
+            unanswered.append(label)
+            continue
+        by_label.setdefault(label, []).append(replies[0][0])
+        deferred[label] = deferred.get(label, 0) + (replies[0][1] in ("deferred", "deferred_update"))
+    ages = [a for v in by_label.values() for a in v]
+    misses = sum(a > sb.INTERACTION_DEADLINE_SECONDS for a in ages) + len(unanswered)
+
+    print(f"\n{len(users)} users, {len(surge.interactions)} interactions in {surge_seconds:.1f}s "
+          f"(Sheets {args.sheets_ms:g}+{args.sheets_jitter_ms:g}ms, errors {args.error_rate:.0%} + landed {args.landed_error_rate:.0%}, "
+          f"Discord {args.discord_ms:g}ms, {'cold' if args.cold else 'prewarmed'})")
+    print(f"{'handler':<40}{'n':>6}{'p50 s':>8}{'p99 s':>8}{'max s':>8}{'defer':>7}{'>3s':>6}")
+    for label, values in sorted(by_label.items()):
+        late = sum(a > sb.INTERACTION_DEADLINE_SECONDS for a in values)
+        print(f"{label:<40}{len(values):>6}{percentile(values, 0.5):>8.3f}{percentile(values, 0.99):>8.3f}{max(values):>8.3f}{deferred[label]:>7}{late:>6}")
+    print(f"{'all':<40}{len(ages):>6}{percentile(ages, 0.5):>8.3f}{percentile(ages, 0.99):>8.3f}{max(ages or [0]):>8.3f}{sum(deferred.values()):>7}")
+
+    problems = check_sheets(surge, signups, history)
+    print(f"\nDeadline misses: {misses} ({len(unanswered)} never answered), handler errors: {len(surge.errors)}")
+    print(f"Confirmed signups: {sum(kc is not None for kc in surge.confirmed.values())}, withdrawals: {sum(kc is None for kc in surge.confirmed.values())}")
+    print(f"Lost writes: {len(problems['lost'])}, duplicate rows: {len(problems['duplicates'])}, withdrawn but listed: {len(problems['ghosts'])}"
+          f"{'' if drained else ' (outbox never drained)'}")
+    print(f"Sheets: {cog.sheets.stats()}, injected errors: {signups.injected + history.injected}")
+    for kind, lines in list(problems.items()) + [("errors", surge.errors)]:
+        for line in lines[:5]:
+            print(f"  - {kind}: {line}")
+
+    cog.store.close()
+    cog.sheets.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+    failed = misses or problems["lost"] or problems["duplicates"] or problems["ghosts"] or not drained
+    print("\n🔥 Surge test failed." if failed else "\n✅ Every interaction answered in time and every write landed exactly once.")
+    return 1 if failed else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the signup handlers against an in-memory Sheets stand-in.")
+    parser.add_argument("--users", type=int, default=300, help="Simulated users")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Seconds over which users arrive")
+    parser.add_argument("--think-min", type=float, default=0.5, help="Fastest form fill, seconds")
+    parser.add_argument("--think-max", type=float, default=3.0, help="Slowest form fill, seconds")
+    parser.add_argument("--mentor-share", type=float, default=0.15, help="Share of users who click Mentor")
+    parser.add_argument("--returning-share", type=float, default=0.5, help="Share of users already in History")
+    parser.add_argument("--resubmit-share", type=float, default=0.1, help="Share who sign up a second time with new KC")
+    parser.add_argument("--withdraw-share", type=float, default=0.1, help="Share who withdraw at the end")
+    parser.add_argument("--sheets-ms", type=float, default=150.0, help="Latency added to every Sheets request")
+    parser.add_argument("--sheets-jitter-ms", type=float, default=100.0, help="Random extra Sheets latency, up to this")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of Sheets requests rejected with 429/503")
+    parser.add_argument("--landed-error-rate", type=float, default=0.0, help="Share that fail with 500 after the write landed")
+    parser.add_argument("--discord-ms", type=float, default=80.0, help="Round trip of each Discord response")
+    parser.add_argument("--flush-seconds", type=float, default=sb.SIGNUP_FLUSH_SECONDS, help="Replication interval")
+    parser.add_argument("--cold", action="store_true", help="Skip the prewarm step before the surge")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,19 +2,29 @@ import os
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-from oauth2client.service_account import ServiceAccountCredentials
-import gspread
 import asyncio
 import re
 from discord import ui, ButtonStyle, Member
 from discord.ui import View, Button, Modal, TextInput
+from aiohttp import web # Ships with discord.py; serves /metrics
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta, timezone, time as dt_time
 from zoneinfo import ZoneInfo
-import gspread.exceptions
 import math
+import random
+import time
+import functools
+import itertools
+import contextlib
+from abc import ABC, abstractmethod
+import sqlite3
+import json
+import hashlib
+import heapq
+import bisect
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path # Import Path for export function
-from zoneinfo import ZoneInfo
 
 # ---------------------------
 # 🔹 Constants
@@ -40,6 +50,35 @@ SANG_SHEET_ID = "1CCpDAJO7Cq581yF_-rz3vx7L_BTettVaKglSvOmvTOE"
 SANG_SHEET_TAB_NAME = "SangSignups"
 SANG_HISTORY_TAB_NAME = "History"
 SANG_SHEET_HEADER = ["Discord_ID", "Discord_Name", "Favorite Roles", "KC", "Has_Scythe", "Proficiency", "Learning Freeze", "Mentor_Request", "Timestamp"]
+SHEETS_MAX_WORKERS = int(os.getenv("SANG_SHEETS_MAX_WORKERS", "4")) # Threads dedicated to blocking gspread calls
+SHEETS_READY_TIMEOUT = float(os.getenv("SANG_SHEETS_READY_TIMEOUT", "10")) # How long a handler waits for the Sheets connection
+SHEETS_RETRY_MAX_SECONDS = float(os.getenv("SANG_SHEETS_RETRY_MAX_SECONDS", "300")) # Backoff cap between connection attempts
+SHEETS_POOL_SIZE = int(os.getenv("SANG_SHEETS_POOL_SIZE", str(SHEETS_MAX_WORKERS))) # Keep-alive connections to Google per host
+SHEETS_CONNECT_TIMEOUT = float(os.getenv("SANG_SHEETS_CONNECT_TIMEOUT", "5")) # Seconds to establish a connection
+SHEETS_READ_TIMEOUT = float(os.getenv("SANG_SHEETS_READ_TIMEOUT", "30")) # Seconds to wait for a response
+SHEETS_READS_PER_MINUTE = int(os.getenv("SANG_SHEETS_READS_PER_MINUTE", "60")) # Google's default per-user read quota
+SHEETS_WRITES_PER_MINUTE = int(os.getenv("SANG_SHEETS_WRITES_PER_MINUTE", "60")) # Google's default per-user write quota
+SHEETS_MAX_RETRIES = int(os.getenv("SANG_SHEETS_MAX_RETRIES", "5")) # Retries for a request answered with 429/5xx
+TOKEN_REFRESH_MARGIN_MINUTES = float(os.getenv("SANG_TOKEN_REFRESH_MARGIN_MINUTES", "10")) # Refresh the token this long before it expires
+SIGNUP_FLUSH_SECONDS = float(os.getenv("SANG_SIGNUP_FLUSH_SECONDS", "5")) # How often local changes are replicated to Sheets
+TEAM_RUN_RETENTION = int(os.getenv("SANG_RUN_RETENTION", "50")) # Matchmaking runs kept on disk for /sangexport
+MATCH_BUDGET_MS = int(os.getenv("SANG_MATCH_BUDGET_MS", "2000")) # Safety cap only; MATCH_MAX_ITERATIONS bounds a normal run
+MATCH_MAX_ITERATIONS = int(os.getenv("SANG_MATCH_MAX_ITERATIONS", "40000")) # Swaps the optimized engine tries; fixes its output
+MATCH_DONOR_TRIES = int(os.getenv("SANG_MATCH_DONOR_TRIES", "64")) # Teams looked at for a swap or a donor per gap (optimized engine, rematch)
+MATCH_CACHE_SIZE = int(os.getenv("SANG_MATCH_CACHE_SIZE", "16")) # Recent matchmaking results kept for repeat runs
+WITHDRAWAL_COMPACT_MINUTES = float(os.getenv("SANG_COMPACT_MINUTES", "10")) # How often withdrawn rows are physically removed
+SHEET_IMPORT_MINUTES = float(os.getenv("SANG_SHEET_IMPORT_MINUTES", "30")) # Re-import both tabs to pick up manual sheet edits
+VC_CONCURRENCY = int(os.getenv("SANG_VC_CONCURRENCY", "3")) # Voice channel creates/moves in flight at once
+TEAM_VC_PREFIX = "SanguineSunday – Team "
+VC_DELETE_RETRIES = int(os.getenv("SANG_VC_DELETE_RETRIES", "3")) # Attempts per channel when Discord answers 429
+AUTO_CLEANUP = os.getenv("SANG_AUTO_CLEANUP", "false").lower() == "true" # Delete team VCs Monday 3 AM CST
+REQUIRE_PERSISTENT_DB = os.getenv("SANG_REQUIRE_PERSISTENT_DB", "true" if os.getenv("DYNO") else "false").lower() == "true" # Refuse to fall back to /tmp for the signup DB (default on Heroku)
+PREWARM_MINUTES = float(os.getenv("SANG_PREWARM_MINUTES", "10")) # Warm caches this long before each scheduled post; 0 disables
+SIGNUP_POST_TIME = dt_time(hour=11, minute=0, tzinfo=CST) # Fridays
+REMINDER_POST_TIME = dt_time(hour=14, minute=0, tzinfo=CST) # Saturdays
+SCHEDULED_POSTS = (("signup", 4, SIGNUP_POST_TIME), ("reminder", 5, REMINDER_POST_TIME)) # (label, weekday, time)
+METRICS_PORT = int(os.getenv("SANG_METRICS_PORT", os.getenv("PORT", "0"))) # Prometheus /metrics port; 0 disables the endpoint
+METRICS_HOST = os.getenv("SANG_METRICS_HOST", "0.0.0.0") # The web dyno must listen on all interfaces
 
 # Message Content
 SANG_MESSAGE_IDENTIFIER = "Sanguine Sunday Sign Up"
@@ -99,9 +138,7 @@ Please make sure you have reviewed the following guides and have your gear and p
 
 We look forward to seeing you there!
 """
-
-# Store last generated teams in memory
-last_generated_teams: List[List[Dict[str, Any]]] = []
+LEARNER_FOLLOWUP_MESSAGE = "⏰ More learners have signed up since the reminder above. Please give it a read!"
 
 # ---------------------------
 # 🔹 Helper Functions
@@ -117,6 +154,15 @@ def sanitize_nickname(name: str) -> str:
     name = re.sub(r'^@', '', name)
     return name.strip()
 
+def prewarm_times(minutes: float) -> List[tuple]:
+    """(label, weekday, time) of a warm-up `minutes` before each scheduled post, wrapping past midnight."""
+    times = []
+    for label, weekday, at in SCHEDULED_POSTS:
+        # 2024-01-01 was a Monday, so the shifted datetime's weekday is the warm-up's own weekday
+        start = datetime(2024, 1, 1 + weekday, at.hour, at.minute) - timedelta(minutes=minutes)
+        times.append((label, start.weekday(), dt_time(start.hour, start.minute, start.second, tzinfo=CST)))
+    return times
+
 def normalize_role(p: dict) -> str:
     """Standardizes a player's proficiency based on their sheet data."""
     prof = str(p.get("proficiency","")).strip().lower()
@@ -160,6 +206,152 @@ def parse_roles(roles_str: str) -> (bool, bool):
     knows_melee = any(s in roles_str for s in ["melee", "mdps", "meleer"])
     return knows_range, knows_melee
 
+class Roster:
+    """
+    Signups held column by column (one list per field) instead of one dict
+    per row. `raiders()` yields the ready-to-use raider dicts the engines take.
+    """
+    __slots__ = ("user_ids", "names", "roles", "kcs", "proficiencies", "scythes", "freezes", "mentees")
+
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def raiders(self):
+        for i, user_id in enumerate(self.user_ids):
+            knows_range, knows_melee = parse_roles(self.roles[i])
+            yield {
+                "user_id": user_id, "user_name": self.names[i],
+                "proficiency": self.proficiencies[i], "kc": self.kcs[i],
+                "has_scythe": self.scythes[i], "roles_known": self.roles[i],
+                "learning_freeze": self.freezes[i],
+                "knows_range": knows_range, "knows_melee": knows_melee,
+                "wants_mentor": self.mentees[i],
+            }
+
+def load_roster(values: List[list], member_ids: Optional[set] = None) -> Roster:
+    """
+    Builds a Roster from get_all_values()-shaped data (header row first),
+    mapping columns by header position. When `member_ids` is given only
+    those Discord IDs are kept. KC is parsed once ("X" for mentors → 9999)
+    and proficiency is re-derived from KC unless the signup is a mentor.
+    """
+    roster = Roster()
+    if not values:
+        return roster
+    col = {name: i for i, name in enumerate(values[0])}
+    def column(name):
+        i = col.get(name)
+        return (lambda row: row[i] if i < len(row) else "") if i is not None else (lambda row: "")
+    get_id, get_name, get_roles, get_kc = column("Discord_ID"), column("Discord_Name"), column("Favorite Roles"), column("KC")
+    get_prof, get_scythe, get_freeze, get_mentee = column("Proficiency"), column("Has_Scythe"), column("Learning Freeze"), column("Mentor_Request")
+
+    for row in values[1:]:
+        user_id = str(get_id(row))
+        if member_ids and user_id not in member_ids:
+            continue # User is not in the specified VC
+        proficiency_val = str(get_prof(row)).lower()
+        try:
+            kc_val = int(get_kc(row))
+        except (ValueError, TypeError):
+            # Handle "X" KC for mentors or bad data
+            kc_val = 9999 if proficiency_val == "mentor" else 0
+        # Re-calculate proficiency based on KC, overriding sheet value (unless they are a mentor)
+        if proficiency_val != "mentor":
+            if kc_val <= 10: proficiency_val = "new"
+            elif kc_val <= 25: proficiency_val = "learner"
+            elif kc_val <= 100: proficiency_val = "proficient"
+            else: proficiency_val = "highly proficient"
+
+        roster.user_ids.append(user_id)
+        roster.names.append(sanitize_nickname(get_name(row)))
+        roster.roles.append(get_roles(row))
+        roster.kcs.append(kc_val)
+        roster.proficiencies.append(proficiency_val)
+        roster.scythes.append(str(get_scythe(row)).upper() == "TRUE")
+        roster.freezes.append(str(get_freeze(row)).upper() == "TRUE")
+        roster.mentees.append(str(get_mentee(row)).upper() == "TRUE")
+    return roster
+
+class Raider:
+    """
+    A signup converted once for matchmaking. Every derived fact the engines
+    compare (role, rank, flags, sort key) is computed here instead of being
+    re-parsed from the dict on each check. `data` is the original dict.
+    """
+    __slots__ = ("data", "user_id", "role", "rank", "kc", "mentor", "strong", "weak", "new",
+                 "freeze", "scythe", "wants_mentor", "sort_key")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.user_id = data.get("user_id")
+        self.role = normalize_role(data)
+        self.rank = PROF_ORDER.get(self.role, 99)
+        try:
+            self.kc = int(data.get("kc", 0))
+        except (ValueError, TypeError):
+            self.kc = 0
+        self.mentor = self.role == "mentor"
+        self.strong = self.role in ("mentor", "highly proficient", "proficient")
+        self.weak = self.role in ("learner", "new")
+        self.new = self.role == "new"
+        self.freeze = bool(data.get("learning_freeze"))
+        self.scythe = bool(data.get("has_scythe"))
+        self.wants_mentor = bool(data.get("wants_mentor"))
+        # Proficiency, then scythe, then KC
+        self.sort_key = (self.rank, not self.scythe, -self.kc)
+
+class Team:
+    """A team under construction. Tracks the counts `can_add` needs so each check is O(1)."""
+    __slots__ = ("members", "max_size", "freezes", "not_strong", "news")
+
+    def __init__(self, max_size: int, members: Optional[List[Raider]] = None):
+        self.members: List[Raider] = []
+        self.max_size = max_size
+        self.freezes = 0
+        self.not_strong = 0
+        self.news = 0
+        for r in members or ():
+            self.add(r)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def add(self, r: Raider):
+        self.members.append(r)
+        self.freezes += r.freeze
+        self.not_strong += not r.strong
+        self.news += r.new
+
+    def pop(self, index: int) -> Raider:
+        r = self.members.pop(index)
+        self.freezes -= r.freeze
+        self.not_strong -= not r.strong
+        self.news -= r.new
+        return r
+
+    def open_slots(self) -> int:
+        return self.max_size - len(self.members)
+
+    def can_add(self, r: Raider) -> bool:
+        """Checks if a player can be added to this team based on constraints."""
+        size = len(self.members)
+        if size >= self.max_size:
+            return False # Team is full
+        # Hard constraints for 3-man teams (must all be proficient+)
+        if self.max_size == 3 and (not r.strong or self.not_strong):
+            return False
+        # Two "Learn Freeze" players cannot be on the same team
+        if r.freeze and self.freezes:
+            return False
+        # No 5-man teams with a "New" player (too hard)
+        if r.new and size + 1 == 5:
+            return False
+        return True
+
 def matchmaking_algorithm(available_raiders: List[Dict[str, Any]]):
     """
     Core algorithm for sorting players into teams.
@@ -174,60 +366,41 @@ def matchmaking_algorithm(available_raiders: List[Dict[str, Any]]):
     """
     
     # ---------- Sort and segment ----------
-    # Sort all raiders by proficiency, then scythe, then KC
-    available_raiders.sort(
-        key=lambda p: (prof_rank(p), not p.get("has_scythe"), -int(p.get("kc", 0)))
-    )
+    # Convert once, then sort all raiders by proficiency, then scythe, then KC
+    raiders = sorted((Raider(p) for p in available_raiders), key=lambda r: r.sort_key)
 
-    mentors = [p for p in available_raiders if normalize_role(p) == "mentor"]
-    non_mentors = [p for p in available_raiders if normalize_role(p) != "mentor"]
+    mentors = [r for r in raiders if r.mentor]
+    non_mentors = [r for r in raiders if not r.mentor]
 
     # Separate non-mentors into pools
-    strong_pool = [p for p in non_mentors if prof_rank(p) <= PROF_ORDER["proficient"]]   # HP/Pro
-    learners    = [p for p in non_mentors if normalize_role(p) == "learner"]
-    news        = [p for p in non_mentors if normalize_role(p) == "new"]
+    strong_pool = [r for r in non_mentors if r.rank <= PROF_ORDER["proficient"]]   # HP/Pro
+    learners    = [r for r in non_mentors if r.role == "learner"]
+    news        = [r for r in non_mentors if r.new]
 
     # Pull out mentees from all non-mentor pools
-    mentees = [p for p in non_mentors if p.get("wants_mentor")]
-    mentee_ids = {m["user_id"] for m in mentees}
-    def _without_mentees(pool): return [p for p in pool if p["user_id"] not in mentee_ids]
+    mentees = [r for r in non_mentors if r.wants_mentor]
+    mentee_ids = {m.user_id for m in mentees}
+    def _without_mentees(pool): return [r for r in pool if r.user_id not in mentee_ids]
     strong_pool = _without_mentees(strong_pool)
     learners    = _without_mentees(learners)
     news        = _without_mentees(news)
 
-    # ---------- Decide target team sizes (only 4/5; 3 only for N in {6,7,11}) ----------
-    N = len(available_raiders)
+    # ---------- Decide target team sizes (4/5, preferring 5s; 3-man teams only when unavoidable) ----------
+    N = len(raiders)
     if N == 0:
         return [], []
 
-    def split_into_4_5(n: int):
-        # Finds non-negative integers a, b such that 4a + 5b = n
-        # Prioritizes maximizing 'b' (number of 5-person teams)
-        for b in range(n // 5, -1, -1):
-            rem = n - 5*b
-            if rem % 4 == 0:
-                a = rem // 4
-                return [5]*b + [4]*a  # prefer 5s first
-        return None # No solution (e.g., N=1, 2, 3, 7, 11)
-
-    sizes = split_into_4_5(N)
-    if sizes is None:
-        # Handle special cases not solvable by 4s and 5s
-        if N == 6:
-            sizes = [3,3]
-        elif N == 7:
-            sizes = [4,3]
-        elif N == 11:
-            sizes = [4,4,3]
-        else:
-            # Fallback guard (shouldn't trigger for N>=12)
-            q, r = divmod(N, 4)
-            sizes = [4]*q + ([3] if r == 3 else ([] if r == 0 else [4])) # Should only be for N<12
+    plan = next(size_plans(N), None)
+    if plan is None:
+        sizes = [4] # N in {1, 2}: one small team
+    else:
+        fives, fours, threes = plan
+        sizes = [5]*fives + [4]*fours + [3]*threes
 
     T = len(sizes) # Total number of teams
 
     # ---------- Build anchors (Mentors first, then strongest HP/Pro) ----------
-    anchors: List[Dict[str, Any]] = []
+    anchors: List[Raider] = []
     if len(mentors) >= T:
         # More mentors than teams; use the first T as anchors
         anchors = mentors[:T]
@@ -238,43 +411,20 @@ def matchmaking_algorithm(available_raiders: List[Dict[str, Any]]):
         strong_pool = strong_pool[(T - len(mentors)):] # Remaining strong players
         extra_mentors = []
 
+    # Every pool is consumed from the front, so use deques (O(1) popleft)
+    mentees.sort(key=lambda r: r.sort_key)
+    strong_pool, learners, news, mentees = deque(strong_pool), deque(learners), deque(news), deque(mentees)
+
     # If still short (edge case, very few players), backfill from any pool
     for pool in (strong_pool, learners, news, mentees):
         while len(anchors) < T and pool:
-            anchors.append(pool.pop(0))
-
-    teams: List[List[Dict[str, Any]]] = [[a] for a in anchors] # Initialize teams with their anchors
-
-    # ---------- Helper for safe placement ----------
-    def can_add(player, team, max_size) -> bool:
-        """Checks if a player can be added to a team based on constraints."""
-        if len(team) >= max_size:
-            return False # Team is full
-        
-        future_size = len(team) + 1
-
-        # Hard constraints for 3-man teams (must all be proficient+)
-        if max_size == 3:
-            if not is_proficient_plus(player):
-                return False # Player not strong enough
-            if not all(is_proficient_plus(p) for p in team):
-                return False # Team not strong enough
-        
-        # Two "Learn Freeze" players cannot be on the same team
-        if player.get('learning_freeze') and any(p.get('learning_freeze') for p in team):
-            return False
-            
-        # No 5-man teams with a "New" player (too hard)
-        if normalize_role(player) == 'new' and future_size == 5:
-            return False
-
-        return True
+            anchors.append(pool.popleft())
 
     max_sizes = list(sizes) # [5, 4, 4]
+    teams: List[Team] = [Team(max_sizes[i], [a]) for i, a in enumerate(anchors)] # Initialize teams with their anchors
 
     # ---------- Place mentees onto Mentor teams first ----------
-    mentor_idxs = [i for i, t in enumerate(teams) if normalize_role(t[0]) == "mentor"]
-    mentees.sort(key=lambda p: (prof_rank(p), not p.get("has_scythe"), -int(p.get("kc", 0))))
+    mentor_idxs = [i for i, t in enumerate(teams) if t.members[0].mentor]
     if mentor_idxs and mentees:
         forward = True # Zig-zag placement
         while mentees:
@@ -284,8 +434,8 @@ def matchmaking_algorithm(available_raiders: List[Dict[str, Any]]):
             for i in idxs:
                 if not mentees:
                     break
-                if can_add(mentees[0], teams[i], max_sizes[i]):
-                    teams[i].append(mentees.pop(0))
+                if teams[i].can_add(mentees[0]):
+                    teams[i].add(mentees.popleft())
                     placed = True
             if not placed:
                 break # No mentor teams have space
@@ -293,34 +443,38 @@ def matchmaking_algorithm(available_raiders: List[Dict[str, Any]]):
     # ---------- One-pass seeding (Distribute learners/newbs evenly) ----------
     # First pass: try to give each team one learner/newb
     for i in range(T):
-        if news and can_add(news[0], teams[i], max_sizes[i]):
-            teams[i].append(news.pop(0))
-        elif learners and can_add(learners[0], teams[i], max_sizes[i]):
-            teams[i].append(learners.pop(0))
+        if news and teams[i].can_add(news[0]):
+            teams[i].add(news.popleft())
+        elif learners and teams[i].can_add(learners[0]):
+            teams[i].add(learners.popleft())
     # Second pass: fill with strong players
     for i in range(T):
-        if strong_pool and can_add(strong_pool[0], teams[i], max_sizes[i]):
-            teams[i].append(strong_pool.pop(0))
+        if strong_pool and teams[i].can_add(strong_pool[0]):
+            teams[i].add(strong_pool.popleft())
 
     # ---------- Distribute leftovers ----------
     # Combine all remaining players into one pool
-    leftovers = strong_pool + learners + news + mentees + extra_mentors
+    leftovers = deque([*strong_pool, *learners, *news, *mentees, *extra_mentors])
+    stranded: List[Raider] = []
+    open_slots = sum(t.open_slots() for t in teams)
     forward = True
-    safety = 0 # Failsafe
-    while leftovers and safety < 10000:
-        safety += 1
+    while leftovers:
+        if open_slots == 0:
+            stranded.extend(leftovers) # Every team is full
+            break
         placed_any = False
-        idxs = list(range(T)) if forward else list(range(T-1, -1, -1))
+        idxs = range(T) if forward else range(T-1, -1, -1)
         forward = not forward
-        
+
         # Try to place the next leftover player
         for i in idxs:
             if not leftovers:
                 break
-            if can_add(leftovers[0], teams[i], max_sizes[i]):
-                teams[i].append(leftovers.pop(0))
+            if teams[i].can_add(leftovers[0]):
+                teams[i].add(leftovers.popleft())
+                open_slots -= 1
                 placed_any = True
-        
+
         if not placed_any:
             # This happens if the next player in `leftovers` can't fit anywhere
             # (e.g., a "New" player, and all teams are full or are 4-mans)
@@ -332,33 +486,1664 @@ def matchmaking_algorithm(available_raiders: List[Dict[str, Any]]):
                     if dj == ti: continue
                     donor_min_keep = 5 if max_sizes[dj] == 5 else (4 if max_sizes[dj] == 4 else 3)
                     if len(teams[dj]) <= donor_min_keep: continue # Can't borrow
-                    
+
                     # Find a proficient player on the donor team
-                    donor = next((p for p in teams[dj] if is_proficient_plus(p)), None)
-                    if donor and can_add(donor, teams[ti], max_sizes[ti]):
-                        teams[ti].append(donor)
-                        teams[dj].remove(donor)
+                    k = next((k for k, r in enumerate(teams[dj].members) if r.strong), None)
+                    if k is not None and teams[ti].can_add(teams[dj].members[k]):
+                        teams[ti].add(teams[dj].pop(k))
                         borrowed = True
-                        placed_any = True
                         break
                 if borrowed: break
-            
-            if not placed_any:
-                # Cycle the player to the back of the queue
-                leftovers.append(leftovers.pop(0))
-    
-    # Any players still in `leftovers` are stranded
-    return teams, leftovers
 
-def format_player_line_plain(guild: discord.Guild, p: dict) -> str:
-    """Formats a player's info for the no-ping /sangmatchtest command."""
-    nickname = p.get("user_name") or "Unknown"
+            if not borrowed:
+                # Teams only ever fill up, so a player who fits nowhere now never
+                # will: strand them immediately instead of cycling the queue
+                stranded.append(leftovers.popleft())
+
+    return [[r.data for r in t.members] for t in teams], [r.data for r in stranded]
+
+def size_plans(n: int, max_threes: int = 2):
+    """
+    Yields candidate (fives, fours, threes) team counts for n players, most
+    preferred first: only 4s and 5s (most 5s first), then plans with more
+    and more 3-man teams, up to `max_threes`.
+    """
+    for threes in range(max_threes + 1):
+        rest = n - 3 * threes
+        if rest < 0:
+            return
+        for fives in range(rest // 5, -1, -1):
+            if (rest - 5 * fives) % 4 == 0:
+                yield fives, (rest - 5 * fives) // 4, threes
+
+def _plan_is_feasible(fives: int, fours: int, threes: int, four_cap: int, counts: tuple) -> bool:
+    """
+    Exact feasibility test for one size plan, in O(1). Eligible team types
+    are nested (New → 4-man only, Learner → 4/5-man, Proficient+ → any), so
+    placing the most restricted players first into the least useful slots
+    is optimal. Freeze players additionally need a team each.
+    """
+    freeze_new, freeze_learner, freeze_strong, new, learner = counts
+    if freeze_new + freeze_learner + freeze_strong > fives + fours + threes or freeze_new > fours:
+        return False
+    learner_in_five = min(freeze_learner, fives)
+    if freeze_new + freeze_learner - learner_in_five > fours:
+        return False
+    strong_in_three = min(freeze_strong, threes)
+    strong_in_five = min(freeze_strong - strong_in_three, fives - learner_in_five)
+    strong_in_four = freeze_strong - strong_in_three - strong_in_five
+    four_left = four_cap - freeze_new - (freeze_learner - learner_in_five) - strong_in_four
+    five_left = 5 * fives - learner_in_five - strong_in_five
+    return new <= four_left and new + learner <= four_left + five_left
+
+def optimized_matchmaking(available_raiders: List[Dict[str, Any]], budget_ms: int = MATCH_BUDGET_MS, seed: int = 0,
+                          max_iterations: int = MATCH_MAX_ITERATIONS, stats: Optional[Dict[str, Any]] = None):
+    """
+    Alternative to matchmaking_algorithm that treats team building as a search.
+
+    Hard constraints are the same as `can_add`: 3-man teams are all
+    Proficient+, at most one Learn Freeze per team, and no New player on a
+    5-man team. The first team-size plan that can satisfy them is chosen
+    exactly, so nobody is stranded whenever a valid assignment exists. A
+    directed pass then gives every team a Proficient+ player and every
+    mentee a mentor where a swap allows it, and a seeded local search
+    (constraint-preserving swaps) runs for up to `max_iterations` swaps on
+    the remaining soft goals: learners, mentors and scythes spread evenly.
+    The greedy engine's teams are scored the same way and returned instead
+    when they are better, so this is never worse than greedy.
+
+    The same input always gives the same teams; `budget_ms` is only a
+    safety cap (greedy's teams are used if it runs out before the search
+    starts). `stats` (if given) records the swaps run, whether the cap cut
+    the run short, and which result was picked.
+    Returns (teams, stranded) like matchmaking_algorithm.
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    greedy_teams, greedy_stranded = matchmaking_algorithm(available_raiders)
+
+    def done(teams_out, stranded_out, iterations, capped, picked):
+        if stats is not None:
+            stats.update(iterations=iterations, time_capped=capped, picked=picked)
+        return teams_out, stranded_out
+
+    if time.perf_counter() >= deadline:
+        return done(greedy_teams, greedy_stranded, 0, True, "greedy")
+    raiders = sorted((Raider(p) for p in available_raiders), key=lambda r: r.sort_key + (str(r.user_id),))
+    N = len(raiders)
+    if N == 0:
+        return done([], [], 0, False, "search")
+
+    # Per-player feature vector: mentor, mentee, weak (New/Learner), strong (Proficient+), scythe, freeze, new
+    features = [
+        (int(r.mentor), int(r.wants_mentor and not r.mentor), int(r.weak),
+         int(r.strong), int(r.scythe), int(r.freeze), int(r.new))
+        for r in raiders
+    ]
+    MENTOR, MENTEE, WEAK, STRONG, SCYTHE, FREEZE, NEW = range(7)
+
+    def kind(i):
+        f = features[i]
+        return "new" if f[NEW] else ("learner" if f[WEAK] else "strong")
+
+    freeze = {"new": [], "learner": [], "strong": []}
+    plain = {"new": [], "learner": [], "strong": []}
+    for i, f in enumerate(features):
+        (freeze if f[FREEZE] else plain)[kind(i)].append(i)
+    counts = (len(freeze["new"]), len(freeze["learner"]), len(freeze["strong"]), len(plain["new"]), len(plain["learner"]))
+
+    # ---------- Pick the most preferred feasible size plan ----------
+    if N < 3:
+        caps = [N] # One small team; treated like a 4-man for the rules
+    else:
+        # 3-man teams are all Proficient+, so more than strong/3 of them can't help
+        # (two are always allowed so N in {3, 6, 7, 11} has a plan at all)
+        strong = len(freeze["strong"]) + len(plain["strong"])
+        # Each check is O(1), so every plan is tried; the deadline only bounds the search.
+        # Prefer a plan that leaves a slot on every 4-man for a Proficient+ player: New
+        # players can only go on 4-mans, and a full 4-man of them can't be swapped into shape
+        max_threes = max(2, strong // 3)
+        chosen = next((p for p in size_plans(N, max_threes) if _plan_is_feasible(p[0], p[1], p[2], 3 * p[1], counts)), None) \
+            or next((p for p in size_plans(N, max_threes) if _plan_is_feasible(p[0], p[1], p[2], 4 * p[1], counts)), None)
+        fives, fours, threes = chosen or next(size_plans(N, max_threes))
+        caps = [5] * fives + [4] * fours + [3] * threes
+    T = len(caps)
+
+    def allows(cap, i):
+        f = features[i]
+        if cap == 3 and f[WEAK]:
+            return False
+        if cap == 5 and f[NEW]:
+            return False
+        return True
+
+    # ---------- Constructive placement ----------
+    by_cap = {c: [t for t in range(T) if caps[t] == c] for c in set(caps)}
+    freeze_order = {
+        "new": [t for t in range(T) if caps[t] not in (3, 5)],
+        "learner": by_cap.get(5, []) + [t for t in range(T) if caps[t] not in (3, 5)],
+        "strong": by_cap.get(3, []) + by_cap.get(5, []) + [t for t in range(T) if caps[t] not in (3, 5)],
+    }
+    # Teams with the sizes interleaved, so mentors seated in this order reach every size evenly
+    share = {t: (j + 0.5) / len(ts) for ts in by_cap.values() for j, t in enumerate(ts)}
+    interleaved = sorted(range(T), key=lambda t: (share[t], caps[t]))
+
+    def construct(mentors_first: bool):
+        """
+        Freeze players first, in the order the feasibility proof uses, then
+        everyone else round-robin by kind. With `mentors_first`, mentors are
+        spread one per team before anyone else and mentees go to their teams.
+        Weak players first leave a slot on every team that has no Proficient+
+        player yet. Returns (teams, stranded).
+        """
+        teams: List[List[int]] = [[] for _ in caps]
+        has_freeze = [False] * T
+        stranded: List[int] = []
+        for k in ("new", "learner", "strong"):
+            for i in freeze[k]:
+                t = next((t for t in freeze_order[k] if not has_freeze[t] and len(teams[t]) < caps[t]), None)
+                if t is None:
+                    stranded.append(i)
+                    continue
+                teams[t].append(i)
+                has_freeze[t] = True
+        has_strong = [any(features[i][STRONG] for i in team) for team in teams]
+
+        def fill(players, eligible, reserve):
+            # Round-robin so each kind starts out evenly spread; returns who didn't fit
+            cursor = 0
+            left = []
+            for i in players:
+                for _ in range(len(eligible)):
+                    t = eligible[cursor % len(eligible)]
+                    cursor += 1
+                    if len(teams[t]) < caps[t] - (reserve and not has_strong[t]):
+                        teams[t].append(i)
+                        has_strong[t] = has_strong[t] or bool(features[i][STRONG])
+                        break
+                else:
+                    left.append(i)
+            return left
+
+        rest = dict(plain)
+        mentor_teams: List[int] = []
+        if mentors_first:
+            rest["strong"] = [i for i in plain["strong"] if not features[i][MENTOR]]
+            stranded += fill([i for i in plain["strong"] if features[i][MENTOR]], interleaved, 0)
+            mentor_teams = [t for t in range(T) if any(features[i][MENTOR] for i in teams[t])]
+        for k in ("new", "learner", "strong"):
+            if not rest[k]:
+                continue
+            eligible = [t for t in range(T) if allows(caps[t], rest[k][0])]
+            pending = fill([i for i in rest[k] if features[i][MENTEE]], [t for t in mentor_teams if allows(caps[t], rest[k][0])], 0)
+            pending += [i for i in rest[k] if not features[i][MENTEE]]
+            for reserve in ((1, 0) if k != "strong" else (0,)):
+                pending = fill(pending, eligible, reserve)
+            stranded += pending
+        return teams, stranded
+
+    teams, stranded = construct(mentors_first=True)
+    if stranded and time.perf_counter() < deadline:
+        # Seating mentors early cost someone their place; use the proof's order
+        teams, stranded = construct(mentors_first=False)
+    if time.perf_counter() >= deadline:
+        return done(greedy_teams, greedy_stranded, 0, True, "greedy")
+
+    # ---------- Soft objective ----------
+    def team_cost(c):
+        cost = 0
+        if c[MENTEE] and not c[MENTOR]:
+            cost += 100 * c[MENTEE] # Mentees should share a team with a mentor
+        if not c[STRONG]:
+            cost += 50 # Every team needs someone who knows the raid
+        return cost + 10 * c[WEAK] ** 2 + 5 * c[MENTOR] ** 2 + c[SCYTHE] ** 2
+
+    def totals(team):
+        return [sum(features[i][k] for i in team) for k in range(7)]
+
+    def valid(cap, c):
+        if c[FREEZE] > 1:
+            return False
+        if cap == 3 and c[WEAK]:
+            return False
+        if cap == 5 and c[NEW]:
+            return False
+        return True
+
+    counters = [totals(team) for team in teams]
+    costs = [team_cost(c) for c in counters]
+
+    def try_swap(a, ia, b, ib) -> bool:
+        """Swaps teams[a][ia] and teams[b][ib] if both teams stay valid and the cost drops."""
+        p, q = teams[a][ia], teams[b][ib]
+        fp, fq = features[p], features[q]
+        if fp == fq:
+            return False
+        new_a = [x - y + z for x, y, z in zip(counters[a], fp, fq)]
+        new_b = [x - y + z for x, y, z in zip(counters[b], fq, fp)]
+        if not (valid(caps[a], new_a) and valid(caps[b], new_b)):
+            return False
+        cost_a, cost_b = team_cost(new_a), team_cost(new_b)
+        if cost_a + cost_b >= costs[a] + costs[b]:
+            return False
+        teams[a][ia], teams[b][ib] = q, p
+        counters[a], counters[b], costs[a], costs[b] = new_a, new_b, cost_a, cost_b
+        return True
+
+    def pull(a, donor_ok, takes, gives) -> bool:
+        """Swaps a `gives` member of team a for a `takes` member of one of the next few donor teams."""
+        # Only MATCH_DONOR_TRIES teams are looked at, so the whole pass stays O(T)
+        for b in itertools.islice(itertools.chain(range(a + 1, T), range(a)), MATCH_DONOR_TRIES):
+            if not donor_ok(b):
+                continue
+            seen = set() # Same features, same outcome
+            for ib, q in enumerate(teams[b]):
+                if not takes(features[q]):
+                    continue
+                for ia, p in enumerate(teams[a]):
+                    pair = (features[p], features[q])
+                    if pair in seen or not gives(features[p]):
+                        continue
+                    seen.add(pair)
+                    if try_swap(a, ia, b, ib):
+                        return True
+        return False
+
+    # ---------- Directed repair of the costliest gaps ----------
+    capped = False
+    for a in range(T):
+        if time.perf_counter() >= deadline:
+            capped = True
+            break
+        if teams[a] and not counters[a][STRONG]:
+            pull(a, lambda b: counters[b][STRONG] >= 2,
+                 lambda f: f[STRONG] and not f[MENTOR], lambda f: not f[STRONG])
+        while counters[a][MENTEE] and not counters[a][MENTOR]:
+            # Bring in a spare mentor, else move a mentee over to a mentor's team
+            if not (pull(a, lambda b: counters[b][MENTOR] >= 2, lambda f: f[MENTOR], lambda f: not f[MENTEE])
+                    or pull(a, lambda b: counters[b][MENTOR] >= 1, lambda f: not f[MENTEE] and not f[MENTOR], lambda f: f[MENTEE])):
+                break
+
+    # ---------- Local search on the soft objective ----------
+    rand = random.Random(seed).random # int(rand() * n) is a seeded pick several times cheaper than randrange
+    stale, stale_limit = 0, max(2000, 40 * N)
+    movable = [t for t in range(T) if teams[t]]
+    M = len(movable)
+    iterations = 0
+    while not capped and M > 1 and stale < stale_limit and iterations < max_iterations:
+        iterations += 1
+        if iterations & 31 == 0 and time.perf_counter() >= deadline:
+            capped = True # Output now depends on machine speed; recorded so it shows up in the run
+            break
+        a, b = movable[int(rand() * M)], movable[int(rand() * M)]
+        if a == b:
+            stale += 1
+            continue
+        if try_swap(a, int(rand() * len(teams[a])), b, int(rand() * len(teams[b]))):
+            stale = 0
+        else:
+            stale += 1
+
+    # ---------- Never worse than greedy ----------
+    def violations(team, c):
+        return (len(team) > 5) + (c[FREEZE] > 1) + (len(team) == 5 and c[NEW] > 0) + (len(team) == 3 and c[STRONG] < 3)
+
+    def score(team_lists, stranded_count):
+        # A broken rule is worse than a stranded player, who is worse than any soft cost
+        broken, soft = 0, 0
+        for team in team_lists:
+            c = totals(team)
+            broken += violations(team, c)
+            soft += team_cost(c)
+        return broken, stranded_count, soft
+
+    index = {id(r.data): i for i, r in enumerate(raiders)}
+    greedy_idx = [[index[id(p)] for p in team] for team in greedy_teams]
+    if score(greedy_idx, len(greedy_stranded)) < score([t for t in teams if t], len(stranded)):
+        return done(greedy_teams, greedy_stranded, iterations, capped, "greedy")
+    result = [[r.data for r in sorted((raiders[i] for i in team), key=lambda r: r.rank)] for team in teams if team]
+    return done(result, [raiders[i].data for i in stranded], iterations, capped, "search")
+
+# Fields the engines read; anything else (names, roles text) doesn't change the teams
+MATCH_FIELDS = ("user_id", "kc", "has_scythe", "learning_freeze", "wants_mentor")
+
+def roster_hash(available_raiders: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Canonical hash of the normalized raider set plus engine params. Input order doesn't matter."""
+    canonical = sorted(
+        [str(p.get("user_id")), normalize_role(p)] + [p.get(f) for f in MATCH_FIELDS[1:]]
+        for p in available_raiders
+    )
+    digest = hashlib.sha256()
+    for entry in canonical: # One raider at a time; a single dump of a big roster doubles peak memory
+        digest.update(json.dumps(entry, separators=(",", ":"), default=str).encode())
+        digest.update(b"\n")
+    digest.update(json.dumps(params, sort_keys=True, separators=(",", ":"), default=str).encode())
+    return digest.hexdigest()
+
+# roster hash -> (team user_id lists, stranded user_ids, search stats), most recently used last
+_match_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def run_matchmaking(available_raiders: List[Dict[str, Any]], engine: str = "greedy"):
+    """
+    Runs the selected engine. Returns (teams, stranded, params), params being
+    what the run store records. Raiders are put in a canonical order first so
+    the same roster always gives the same teams, and recent results are
+    memoized by roster hash: /sangmatch right after /sangmatchtest on an
+    unchanged roster reuses exactly the teams the preview showed.
+    """
+    if engine == "optimized":
+        params = {"algorithm": "optimized", "max_iterations": MATCH_MAX_ITERATIONS, "budget_ms": MATCH_BUDGET_MS, "seed": 0}
+    else:
+        params = {"algorithm": "greedy"}
+    key = roster_hash(available_raiders, params)
+    by_id = {str(p.get("user_id")): p for p in available_raiders}
+
+    cached = _match_cache.get(key)
+    if cached is not None:
+        _match_cache.move_to_end(key)
+        team_ids, stranded_ids, stats = cached
+        print(f"♻️ Reusing cached {params['algorithm']} teams for an unchanged roster of {len(by_id)}.")
+        teams = [[by_id[uid] for uid in ids] for ids in team_ids]
+        return teams, [by_id[uid] for uid in stranded_ids], dict(params, roster_hash=key, **stats)
+
+    raiders = sorted(available_raiders, key=lambda p: str(p.get("user_id")))
+    stats: Dict[str, Any] = {}
+    if engine == "optimized":
+        teams, stranded = optimized_matchmaking(
+            raiders, budget_ms=MATCH_BUDGET_MS, seed=params["seed"],
+            max_iterations=MATCH_MAX_ITERATIONS, stats=stats,
+        )
+        if stats["time_capped"]:
+            print(f"⚠️ Optimized matchmaking hit its {MATCH_BUDGET_MS}ms cap after {stats['iterations']} swaps; teams may vary between runs and won't be cached.")
+    else:
+        teams, stranded = matchmaking_algorithm(raiders)
+
+    # A capped run depends on machine speed, so a rerun may give other teams; only cache reproducible ones
+    if MATCH_CACHE_SIZE > 0 and not stats.get("time_capped"):
+        _match_cache[key] = (
+            [[str(p.get("user_id")) for p in team] for team in teams],
+            [str(p.get("user_id")) for p in stranded],
+            stats,
+        )
+        while len(_match_cache) > MATCH_CACHE_SIZE:
+            _match_cache.popitem(last=False)
+    return teams, stranded, dict(params, roster_hash=key, **stats)
+
+class TeamAssignment:
+    """
+    Where everyone in a stored run sits: user_id -> team index, plus the
+    teams with room and the 5-man teams (the only ones a repair can add
+    to or borrow from). Built once per run and cached by run id.
+    """
+    __slots__ = ("team_of", "open_teams", "five_teams", "dupes")
+
+    def __init__(self, teams: List[List[Dict[str, Any]]]):
+        self.team_of: Dict[str, int] = {}
+        self.dupes = set() # Teams listing someone already seated earlier; a repair rebuilds them
+        for t, team in enumerate(teams):
+            for p in team:
+                if self.team_of.setdefault(str(p.get("user_id")), t) != t:
+                    self.dupes.add(t)
+        self.open_teams = [t for t, team in enumerate(teams) if len(team) < 5]
+        self.five_teams = [t for t, team in enumerate(teams) if len(team) >= 5]
+
+# run id -> TeamAssignment, most recently used last
+_assignment_cache: "OrderedDict[int, TeamAssignment]" = OrderedDict()
+
+def team_assignment(teams: List[List[Dict[str, Any]]], run_id: Optional[int] = None) -> TeamAssignment:
+    """Returns the assignment index for a run, reusing the cached one for `run_id` when there is one."""
+    cached = _assignment_cache.get(run_id) if run_id is not None else None
+    if cached is not None:
+        _assignment_cache.move_to_end(run_id)
+        return cached
+    assignment = TeamAssignment(teams)
+    if run_id is not None and MATCH_CACHE_SIZE > 0:
+        _assignment_cache[run_id] = assignment
+        while len(_assignment_cache) > MATCH_CACHE_SIZE:
+            _assignment_cache.popitem(last=False)
+    return assignment
+
+def repair_teams(previous_teams: List[List[Dict[str, Any]]], available_raiders: List[Dict[str, Any]],
+                 assignment: Optional[TeamAssignment] = None):
+    """
+    Incremental rematch. Everyone still present stays on their previous
+    team; only the delta moves. Joiners (and anyone stranded last time)
+    fill vacated slots first, then grow teams one size up, and only then
+    form new teams among themselves. Teams left under 3, new ones included,
+    borrow a player from a 5-man team, or are dissolved into teams with
+    room. Every placement goes through the same `can_add` rules as a full run.
+
+    Leavers and joiners are looked up in `assignment` (built from
+    `previous_teams` if not given), so only the teams they touch are
+    rebuilt; every other team comes back with its exact membership.
+    Returns (teams, stranded, moved) with `moved` the user_ids placed or moved.
+    """
+    assignment = assignment or TeamAssignment(previous_teams)
+    team_of = assignment.team_of
+    current = {str(p.get("user_id")): p for p in available_raiders}
+    left = team_of.keys() - current.keys()
+    joined = current.keys() - team_of.keys()
+
+    built: Dict[int, Team] = {} # Previous teams rebuilt as Team objects, only once one is needed
+    gone = set() # Previous teams that emptied or were dissolved
+
+    def team_at(t: int) -> Team:
+        if t not in built:
+            ids = [str(p.get("user_id")) for p in previous_teams[t]]
+            present = [Raider(current[uid]) for uid in ids if uid in current and team_of[uid] == t]
+            built[t] = Team(min(5, max(3, len(ids))), present)
+        return built[t]
+
+    touched: List[Team] = [] # Teams that lost someone; they take joiners first
+    for t in sorted({team_of[uid] for uid in left} | assignment.dupes):
+        if team_at(t).members:
+            touched.append(built[t])
+        else:
+            gone.add(t)
+
+    def live(indices):
+        # Rebuilt teams merged into `indices`, in previous-run order like a full scan would visit them
+        merged = (t for t, _ in itertools.groupby(heapq.merge(sorted(built), indices)))
+        return (team_at(t) for t in merged if t not in gone)
+
+    moved = set()
+    def place(r: Raider, candidates) -> bool:
+        # Fill an open slot, else grow a team by one (up to 5) if the rules still hold.
+        # Candidates are built lazily, so a joiner who fits early never rebuilds the rest
+        seen = []
+        for t in candidates:
+            if t.can_add(r):
+                t.add(r)
+                moved.add(r.user_id)
+                return True
+            seen.append(t)
+        for t in seen:
+            if len(t) == t.max_size < 5 and not (len(t) == 4 and t.news):
+                t.max_size += 1
+                if t.can_add(r):
+                    t.add(r)
+                    moved.add(r.user_id)
+                    return True
+                t.max_size -= 1
+        return False
+
+    # ---------- Place joiners ----------
+    joiners = sorted((Raider(current[uid]) for uid in joined), key=lambda r: (r.sort_key, str(r.user_id)))
+    undersized = lambda: [t for t in touched if len(t) < 3]
+    unplaced = [r for r in joiners if not (place(r, undersized() + touched) or place(r, live(assignment.open_teams)))]
+    stranded: List[Dict[str, Any]] = []
+    formed: List[Team] = [] # New teams built from joiners; they get the same under-3 repair
+    if len(unplaced) >= 3:
+        new_teams, new_stranded = matchmaking_algorithm([r.data for r in unplaced])
+        for team in new_teams:
+            formed.append(Team(max(3, len(team)), [Raider(p) for p in team]))
+            moved.update(str(p.get("user_id")) for p in team)
+        stranded.extend(new_stranded)
+    else:
+        stranded.extend(r.data for r in unplaced)
+
+    # ---------- Repair teams left under 3 ----------
+    for small in undersized() + [t for t in formed if len(t) < 3]:
+        donors = itertools.chain(live(assignment.five_teams), formed)
+        for donor in itertools.islice(donors, MATCH_DONOR_TRIES):
+            if len(small) >= 3:
+                break
+            if donor is small or len(donor) < 5:
+                continue
+            k = next((k for k, r in enumerate(donor.members) if small.can_add(r)), None)
+            if k is not None:
+                r = donor.pop(k)
+                donor.max_size = 4
+                small.add(r)
+                moved.add(r.user_id)
+        if len(small) < 3:
+            # Dissolve it; anyone who fits nowhere else keeps their old short team, joiners are stranded
+            others = lambda: (t for t in itertools.chain(live(assignment.open_teams), formed) if t is not small)
+            for r in list(small.members):
+                small.pop(small.members.index(r))
+                if place(r, others()):
+                    continue
+                if small in formed:
+                    moved.discard(r.user_id)
+                    stranded.append(r.data)
+                else:
+                    small.add(r)
+            if not small.members:
+                if small in formed:
+                    formed.remove(small)
+                else:
+                    gone.update(t for t, team in built.items() if team is small)
+
+    # Untouched teams are never rebuilt: same players, same order, with their current signup data
+    result = []
+    for t, previous in enumerate(previous_teams):
+        if t in built:
+            if t not in gone:
+                result.append([r.data for r in built[t].members])
+        elif previous:
+            result.append([current[str(p.get("user_id"))] for p in previous])
+    result.extend([r.data for r in t.members] for t in formed)
+    return result, stranded, moved
+
+def format_player_line(p: dict, name: str) -> str:
+    """Formats a player's info for team output; `name` is a mention or a plain nickname."""
     role_text = p.get("proficiency", "Unknown").replace(" ", "-").capitalize().replace("-", " ")
     kc_raw = p.get("kc", 0)
     kc_text = f"({kc_raw} KC)" if isinstance(kc_raw, int) and kc_raw > 0 and role_text != "Mentor" and kc_raw != 9999 else ""
     scythe = scythe_icon(p)
     freeze = freeze_icon(p)
-    return f"{nickname} • **{role_text}** {kc_text} • {scythe} Scythe {freeze}"
+    return f"{name} • **{role_text}** {kc_text} • {scythe} Scythe {freeze}"
+
+def format_player_line_plain(guild: discord.Guild, p: dict) -> str:
+    """Formats a player's info for the no-ping /sangmatchtest command."""
+    return format_player_line(p, p.get("user_name") or "Unknown")
+
+def format_player_line_mention(guild: discord.Guild, p: dict) -> str:
+    """Formats a player's info with a mention, for /sangmatch."""
+    try:
+        uid = int(p["user_id"])
+        member = guild.get_member(uid)
+        mention = member.mention if member else f"<@{uid}>"
+    except Exception:
+        mention = f"@{p.get('user_name', 'Unknown')}"
+    return format_player_line(p, mention)
+
+# ---------------------------
+# 🔹 Message Rendering
+# ---------------------------
+
+# Discord limits
+MESSAGE_LIMIT = 2000
+EMBED_FIELD_LIMIT = 1024
+EMBED_MAX_FIELDS = 25
+EMBED_TOTAL_LIMIT = 6000 # Per embed, and for all embeds in one message
+MESSAGE_MAX_EMBEDS = 10
+
+def chunk_lines(lines: List[str], limit: int, sep: str = "\n") -> List[str]:
+    """Joins lines into as few chunks of at most `limit` characters as possible. An over-long line is hard-split."""
+    chunks, current = [], ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}{sep}{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def team_fields(teams: List[List[Dict[str, Any]]], line_for) -> List[tuple]:
+    """(name, value) embed fields for every team; a team too long for one field continues in the next."""
+    fields = []
+    for i, team in enumerate(teams, start=1):
+        lines = [line_for(p) for p in sorted(team, key=prof_rank)] or ["—"]
+        for k, value in enumerate(chunk_lines(lines, EMBED_FIELD_LIMIT)):
+            fields.append((f"Team {i} (Size: {len(team)})" + (" (cont.)" if k else ""), value))
+    return fields
+
+def build_embed_pages(title: str, description: str, color: discord.Color, fields: List[tuple],
+                      footer: Optional[str] = None) -> List[List[discord.Embed]]:
+    """
+    Packs fields into as few embeds as the field-count and size limits allow,
+    then packs the embeds into as few messages as possible. Returns one list
+    of embeds per message.
+    """
+    reserve = len(title) + len(" (00/00)") + len(footer or "")
+    embeds: List[discord.Embed] = [discord.Embed(title=title, description=description, color=color)]
+    size = reserve + len(description or "")
+    for name, value in fields:
+        if len(embeds[-1].fields) >= EMBED_MAX_FIELDS or size + len(name) + len(value) > EMBED_TOTAL_LIMIT:
+            embeds.append(discord.Embed(title=title, color=color))
+            size = reserve
+        embeds[-1].add_field(name=name, value=value, inline=False)
+        size += len(name) + len(value)
+    if len(embeds) > 1:
+        for page, embed in enumerate(embeds, start=1):
+            embed.title = f"{title} ({page}/{len(embeds)})"
+    if footer:
+        embeds[-1].set_footer(text=footer)
+
+    messages: List[List[discord.Embed]] = [[]]
+    total = 0
+    for embed in embeds:
+        if len(messages[-1]) >= MESSAGE_MAX_EMBEDS or (messages[-1] and total + len(embed) > EMBED_TOTAL_LIMIT):
+            messages.append([])
+            total = 0
+        messages[-1].append(embed)
+        total += len(embed)
+    return messages
+
+def build_ping_messages(header: str, label: str, pings: List[str]) -> List[str]:
+    """Splits a ping list into as few messages under Discord's 2000-character limit as possible."""
+    first_limit = MESSAGE_LIMIT - len(header) - len(label) - 3
+    chunks = chunk_lines(pings, first_limit, sep=" ")
+    if not chunks:
+        return [header]
+    rest = chunk_lines(" ".join(chunks[1:]).split(" "), MESSAGE_LIMIT, sep=" ") if len(chunks) > 1 else []
+    return [f"{header}\n\n{label} {chunks[0]}"] + rest
+
+async def send_in_order(send, pages: list, **kwargs) -> list:
+    """
+    Sends the pages one after another and returns the messages in page order.
+    They aren't sent concurrently: discord.py lets several requests in one
+    rate-limit bucket run at once, so concurrent pages can land out of order.
+    """
+    messages = []
+    for page in pages:
+        if isinstance(page, list):
+            messages.append(await send(embeds=page, **kwargs))
+        else:
+            messages.append(await send(page, **kwargs))
+    return messages
+
+# ---------------------------
+# 🔹 Metrics
+# ---------------------------
+
+INTERACTION_DEADLINE_SECONDS = 3.0 # Discord fails an interaction not answered within this
+NEAR_MISS_SECONDS = float(os.getenv("SANG_NEAR_MISS_SECONDS", "1.5")) # First responses slower than this are logged for profiling
+DEFER_AFTER_SECONDS = float(os.getenv("SANG_DEFER_AFTER_SECONDS", "2.0")) # Guarded handlers still working at this age get deferred
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Fixed-bucket latency histogram in the Prometheus layout, plus a running sum."""
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1) # The last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates the q-quantile by interpolating inside the bucket it falls in."""
+        rank = q * self.count
+        seen, lower = 0, 0.0
+        for bound, n in zip(LATENCY_BUCKETS, self.counts):
+            if n and seen + n >= rank:
+                return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return LATENCY_BUCKETS[-1] if self.counts[-1] else 0.0
+
+class Metrics:
+    """
+    In-process latency, call and error counts for every instrumented
+    handler and Sheets request, keyed by (kind, name). Interactions also
+    record their time to first response against Discord's 3s deadline.
+    """
+    def __init__(self):
+        self.latency: Dict[tuple, Histogram] = {}
+        self.errors: Dict[tuple, int] = {}
+        self.first_response: Dict[tuple, Histogram] = {}
+        self.deadline_misses: Dict[tuple, int] = {}
+        self.near_misses: Dict[tuple, int] = {}
+        self.recent_near_misses = deque(maxlen=50) # (when, kind, name, seconds, auto_deferred)
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False):
+        key = (kind, name)
+        self.latency.setdefault(key, Histogram()).observe(seconds)
+        if error:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def observe_first_response(self, kind: str, name: str, seconds: float, auto_deferred: bool = False):
+        key = (kind, name)
+        self.first_response.setdefault(key, Histogram()).observe(seconds)
+        if seconds > INTERACTION_DEADLINE_SECONDS:
+            self.deadline_misses[key] = self.deadline_misses.get(key, 0) + 1
+        if seconds > NEAR_MISS_SECONDS or auto_deferred:
+            self.near_misses[key] = self.near_misses.get(key, 0) + 1
+            self.recent_near_misses.append((datetime.now(CST), kind, name, seconds, auto_deferred))
+            print(f"⚠️ {kind} {name} first responded after {seconds:.2f}s{' (auto-deferred)' if auto_deferred else ''}.")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per (kind, name): calls, errors, p50/p99 latency and first-response p99/misses."""
+        rows = []
+        for key in sorted(self.latency):
+            h, first = self.latency[key], self.first_response.get(key)
+            rows.append({
+                "kind": key[0], "name": key[1], "calls": h.count, "errors": self.errors.get(key, 0),
+                "p50": h.quantile(0.5), "p99": h.quantile(0.99),
+                "first_p99": first.quantile(0.99) if first else None,
+                "misses": self.deadline_misses.get(key, 0), "near": self.near_misses.get(key, 0),
+            })
+        return rows
+
+    @staticmethod
+    def _labels(key: tuple, **extra) -> str:
+        pairs = [("kind", key[0]), ("name", key[1])] + list(extra.items())
+        escaped = ((k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+        return ",".join(f'{k}="{v}"' for k, v in escaped)
+
+    def _histogram_lines(self, metric: str, help_text: str, histograms: Dict[tuple, Histogram]) -> List[str]:
+        lines = [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for key in sorted(histograms):
+            h = histograms[key]
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), h.counts):
+                cumulative += n
+                lines.append(f"{metric}_bucket{{{self._labels(key, le=bound)}}} {cumulative}")
+            lines.append(f"{metric}_sum{{{self._labels(key)}}} {h.total:.6f}")
+            lines.append(f"{metric}_count{{{self._labels(key)}}} {h.count}")
+        return lines
+
+    def render(self, gauges: Optional[Dict[str, Dict[str, int]]] = None) -> str:
+        """Everything in Prometheus text format. `gauges` maps a metric name to {stat: value}."""
+        lines = self._histogram_lines("sang_handler_seconds", "Latency of handlers and Sheets requests.", self.latency)
+        lines += ["# HELP sang_handler_errors_total Handler calls that raised.", "# TYPE sang_handler_errors_total counter"]
+        lines += [f"sang_handler_errors_total{{{self._labels(k)}}} {v}" for k, v in sorted(self.errors.items())]
+        lines += self._histogram_lines("sang_first_response_seconds", "Time from interaction creation to its first response.", self.first_response)
+        lines += [f"# HELP sang_deadline_misses_total First responses later than {INTERACTION_DEADLINE_SECONDS:g}s.", "# TYPE sang_deadline_misses_total counter"]
+        lines += [f"sang_deadline_misses_total{{{self._labels(k)}}} {v}" for k, v in sorted(self.deadline_misses.items())]
+        lines += [f"# HELP sang_deadline_near_misses_total First responses later than {NEAR_MISS_SECONDS:g}s or auto-deferred.", "# TYPE sang_deadline_near_misses_total counter"]
+        lines += [f"sang_deadline_near_misses_total{{{self._labels(k)}}} {v}" for k, v in sorted(self.near_misses.items())]
+        for metric, stats in (gauges or {}).items():
+            lines.append(f"# TYPE {metric} gauge")
+            lines += [f'{metric}{{stat="{stat}"}} {value}' for stat, value in stats.items()]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def interaction_age(interaction: discord.Interaction) -> float:
+    """Seconds since Discord created the interaction (the deadline clock)."""
+    return max(0.0, (discord.utils.utcnow() - interaction.created_at).total_seconds())
+
+def record_first_response(interaction: discord.Interaction):
+    """
+    Records the interaction's first response for the handler `instrumented`
+    is timing. Called right after the response goes out: by `reply()` and
+    `auto_defer()`, and by handlers that defer or open a modal themselves.
+    """
+    handler = interaction.extras.get("sang_handler")
+    if handler is None or interaction.extras.get("sang_first_response"):
+        return
+    interaction.extras["sang_first_response"] = True
+    kind, name = handler
+    metrics.observe_first_response(kind, name, interaction_age(interaction), interaction.extras.get("sang_auto_deferred", False))
+
+def instrumented(kind: str):
+    """
+    Decorator for async handlers ("command", "button", "modal", "task"):
+    records latency and errors. When one of the arguments is an
+    Interaction, the handler is noted on it so `record_first_response`
+    can time its first response.
+    """
+    def decorator(func):
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next((a for a in args if isinstance(a, discord.Interaction)), None)
+            if interaction is not None:
+                interaction.extras.setdefault("sang_handler", (kind, name))
+            start = time.perf_counter()
+            error = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                metrics.observe(kind, name, time.perf_counter() - start, error)
+        return wrapper
+    return decorator
+
+# ---------------------------
+# 🔹 Interaction Deadline Guard
+# ---------------------------
+
+def reply_lock(interaction: discord.Interaction) -> asyncio.Lock:
+    """Serializes a handler's replies with the guard's auto-defer on the same interaction."""
+    return interaction.extras.setdefault("sang_reply_lock", asyncio.Lock())
+
+async def reply(interaction: discord.Interaction, content: Optional[str] = None, **kwargs):
+    """Answers an interaction: the initial response while it is still open, otherwise a followup."""
+    async with reply_lock(interaction):
+        if interaction.response.is_done():
+            return await interaction.followup.send(content, **kwargs)
+        result = await interaction.response.send_message(content, **kwargs)
+        record_first_response(interaction)
+        return result
+
+async def auto_defer(interaction: discord.Interaction, ephemeral: bool = True):
+    """Defers the interaction unless the handler already answered it."""
+    async with reply_lock(interaction):
+        if interaction.response.is_done():
+            return
+        interaction.extras["sang_auto_deferred"] = True
+        try:
+            await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+            record_first_response(interaction)
+        except discord.HTTPException as e:
+            print(f"⚠️ Could not auto-defer an interaction: {e}")
+
+def deadline_guard(ephemeral: bool = True):
+    """
+    Decorator for interaction handlers that answer through `reply()`. If
+    the handler hasn't responded by DEFER_AFTER_SECONDS after Discord
+    created the interaction, the guard defers it and the handler's
+    replies go out as followups. A handler that starts late (a busy
+    event loop during a signup surge) is deferred before it runs.
+    Handlers that open a modal can't be deferred; they must answer from
+    in-memory state instead.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next((a for a in args if isinstance(a, discord.Interaction)), None)
+            if interaction is None:
+                return await func(*args, **kwargs)
+            remaining = DEFER_AFTER_SECONDS - interaction_age(interaction)
+            if remaining <= 0:
+                await auto_defer(interaction, ephemeral)
+                return await func(*args, **kwargs)
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            try:
+                await asyncio.wait({task}, timeout=remaining)
+                if not task.done():
+                    await auto_defer(interaction, ephemeral)
+                return await task
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+        return wrapper
+    return decorator
+
+# ---------------------------
+# 🔹 Google Sheets Gateway
+# ---------------------------
+
+# Priority lanes: lower goes first
+PRIORITY_STAFF = 0 # A staff member is waiting on the result
+PRIORITY_BULK = 1  # Background replication, compaction and scheduled imports
+RETRY_STATUSES = {429, 500, 502, 503} # Reads are safe to repeat on any of these
+WRITE_RETRY_STATUSES = {429} # A write answered 5xx may still have landed, and appends/deletes aren't safe to replay
+
+class PriorityGate(ABC):
+    """
+    Hands out permits in priority order (then FIFO). Subclasses decide when
+    a permit is available: a worker slot, or a rate-limit token.
+    """
+    def __init__(self):
+        self._waiters: list = [] # heap of (priority, seq, future)
+        self._seq = 0
+        self.waited = 0 # Acquisitions that had to queue
+
+    @abstractmethod
+    def _available(self) -> bool:
+        """Whether a permit can be handed out right now."""
+
+    @abstractmethod
+    def _take(self):
+        """Consumes one permit."""
+
+    async def acquire(self, priority: int = PRIORITY_BULK):
+        if not self._waiters and self._available():
+            self._take()
+            return
+        self.waited += 1
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._give_back() # Granted just as we were cancelled
+            raise
+
+    @abstractmethod
+    def _give_back(self):
+        """Returns a permit that was granted but never used."""
+
+    def _dispatch(self):
+        while self._waiters and self._available():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done(): # Cancelled while queued
+                continue
+            self._take()
+            future.set_result(None)
+
+class WorkerSlots(PriorityGate):
+    """Limits concurrent Sheets calls to the pool size so staff work takes the next free thread."""
+    def __init__(self, slots: int):
+        super().__init__()
+        self.free = slots
+
+    def _available(self) -> bool:
+        return self.free > 0
+
+    def _take(self):
+        self.free -= 1
+
+    def _give_back(self):
+        self.release()
+
+    def release(self):
+        self.free += 1
+        self._dispatch()
+
+class TokenBucket(PriorityGate):
+    """A per-minute request quota that refills continuously."""
+    def __init__(self, per_minute: int):
+        super().__init__()
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1
+
+    def _take(self):
+        self.tokens -= 1
+
+    def _give_back(self):
+        self.tokens += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        super()._dispatch()
+        if self._waiters and self._timer is None:
+            # Wake up when the next token is due
+            self._timer = asyncio.get_running_loop().call_later((1 - self.tokens) / self.rate, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+class SheetGateway:
+    """
+    Runs every blocking gspread call on a small dedicated thread pool
+    so a slow Sheets round-trip never stalls the Discord event loop.
+    Each call first takes a read or write token from the per-minute
+    quota buckets and a worker slot, both handed out staff-first. Reads
+    answered with 429/5xx and writes answered with 429 (never applied) are
+    retried with exponential backoff and jitter; a write that fails with a
+    5xx is left to the caller, which re-locates its rows before resending.
+    """
+    def __init__(self, max_workers: int = SHEETS_MAX_WORKERS, reads_per_minute: int = SHEETS_READS_PER_MINUTE,
+                 writes_per_minute: int = SHEETS_WRITES_PER_MINUTE):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sang-sheets")
+        self._slots = WorkerSlots(max_workers)
+        self._buckets = {"read": TokenBucket(reads_per_minute), "write": TokenBucket(writes_per_minute)}
+        self.counters = {"read": 0, "write": 0, "retries": 0, "failures": 0}
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs any blocking callable on the Sheets pool and awaits its result (no
+        quota accounting). If the caller is cancelled, the request is already
+        on the wire, so it is waited out first: no lock the caller holds is
+        released while its write can still land.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+
+    async def call(self, kind: str, func, *args, priority: Optional[int] = None, retry_on: Optional[set] = None, **kwargs):
+        """
+        Runs one Sheets request under the `kind` ("read"/"write") quota,
+        retrying the `retry_on` statuses (by default RETRY_STATUSES for reads,
+        WRITE_RETRY_STATUSES for writes).
+        """
+        if priority is None:
+            priority = PRIORITY_STAFF if kind == "read" else PRIORITY_BULK
+        if retry_on is None:
+            retry_on = RETRY_STATUSES if kind == "read" else WRITE_RETRY_STATUSES
+        start = time.perf_counter()
+        error = False
+        try:
+            return await self._call(kind, func, priority, retry_on, *args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            # Includes quota waits and retries: what the caller actually experienced
+            metrics.observe("sheets", f"{kind}:{getattr(func, '__name__', 'call')}", time.perf_counter() - start, error)
+
+    async def _call(self, kind: str, func, priority: int, retry_on: set, *args, **kwargs):
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            await self._buckets[kind].acquire(priority)
+            await self._slots.acquire(priority)
+            try:
+                self.counters[kind] += 1
+                return await self.run(func, *args, **kwargs)
+            except Exception as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if status not in retry_on or attempt == SHEETS_MAX_RETRIES:
+                    self.counters["failures"] += 1
+                    raise
+                self.counters["retries"] += 1
+            finally:
+                self._slots.release()
+            delay = min(64, 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"⚠️ Sheets answered {status}; retry {attempt + 1}/{SHEETS_MAX_RETRIES} in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, int]:
+        """Requests sent per kind, retries, failures, and how many requests had to wait for quota."""
+        return dict(self.counters, read_throttled=self._buckets["read"].waited,
+                    write_throttled=self._buckets["write"].waited, slot_waits=self._slots.waited)
+
+    async def find(self, worksheet, query: str, in_column: Optional[int] = None, priority: Optional[int] = None):
+        return await self.call("read", worksheet.find, query, in_column=in_column, priority=priority)
+
+    async def append_row(self, worksheet, values: list, priority: Optional[int] = None):
+        return await self.call("write", worksheet.append_row, values, priority=priority)
+
+    async def update(self, worksheet, values: List[list], range_name: str, priority: Optional[int] = None):
+        return await self.call("write", worksheet.update, values=values, range_name=range_name, priority=priority)
+
+    async def delete_rows(self, worksheet, start_index: int, end_index: Optional[int] = None, priority: Optional[int] = None):
+        return await self.call("write", worksheet.delete_rows, start_index, end_index, priority=priority)
+
+    async def append_rows(self, worksheet, rows: List[list], priority: Optional[int] = None):
+        return await self.call("write", worksheet.append_rows, rows, priority=priority)
+
+    async def batch_update(self, worksheet, data: List[Dict[str, Any]], priority: Optional[int] = None):
+        return await self.call("write", worksheet.batch_update, data, priority=priority)
+
+    async def col_values(self, worksheet, col: int, priority: Optional[int] = None) -> list:
+        return await self.call("read", worksheet.col_values, col, priority=priority)
+
+    async def batch_get(self, worksheet, ranges: List[str], priority: Optional[int] = None) -> list:
+        return await self.call("read", worksheet.batch_get, ranges, priority=priority)
+
+    async def delete_row_set(self, worksheet, rows: List[int], priority: Optional[int] = None):
+        """
+        Deletes any set of rows with a single batchUpdate request. Never
+        retried: once any deletion has landed, resending the same indexes
+        would delete other users' rows.
+        """
+        # Bottom-up, so each deletion leaves the remaining indexes untouched
+        requests = [
+            {"deleteDimension": {"range": {"sheetId": worksheet.id, "dimension": "ROWS", "startIndex": r - 1, "endIndex": r}}}
+            for r in sorted(set(rows), reverse=True)
+        ]
+        return await self.call("write", worksheet.spreadsheet.batch_update, {"requests": requests}, priority=priority, retry_on=set())
+
+    async def get_all_records(self, worksheet, priority: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await self.call("read", worksheet.get_all_records, priority=priority)
+
+    async def row_values(self, worksheet, row: int, priority: Optional[int] = None) -> list:
+        return await self.call("read", worksheet.row_values, row, priority=priority)
+
+    async def clear(self, worksheet, priority: Optional[int] = None):
+        return await self.call("write", worksheet.clear, priority=priority)
+
+    def shutdown(self):
+        """Stops accepting new work; in-flight calls are allowed to finish."""
+        self._executor.shutdown(wait=False)
+
+class SheetsSession:
+    """
+    One pooled keep-alive HTTP session for every Sheets request, with the
+    service-account token cached and refreshed ahead of expiry (see
+    `refresh_if_expiring`) so no signup waits on a token round-trip.
+    """
+    def __init__(self, credentials_info: Dict[str, Any], scopes: List[str], pool_size: int = SHEETS_POOL_SIZE):
+        import requests
+        from google.oauth2.service_account import Credentials
+        from google.auth.transport.requests import AuthorizedSession, Request
+        from requests.adapters import HTTPAdapter
+
+        self.credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
+        # Token refreshes get their own keep-alive session: going through the authorized
+        # session would attach (and maybe refresh) the old token on the token request itself
+        self._token_session = requests.Session()
+        self._token_session.mount("https://", HTTPAdapter(max_retries=3))
+        self._auth_request = Request(self._token_session)
+        self.session = AuthorizedSession(self.credentials, auth_request=self._auth_request)
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", self._adapter)
+        self.token_refreshes = 0
+
+    def client(self):
+        """A gspread client that sends everything through this session, with connect/read timeouts."""
+        import gspread
+        client = gspread.Client(auth=self.credentials, session=self.session)
+        client.set_timeout((SHEETS_CONNECT_TIMEOUT, SHEETS_READ_TIMEOUT))
+        return client
+
+    def refresh_if_expiring(self, margin: timedelta = timedelta(minutes=TOKEN_REFRESH_MARGIN_MINUTES)) -> bool:
+        """Blocking: refreshes the token if it is missing or expires within `margin`. Returns True if it refreshed."""
+        expiry = self.credentials.expiry # Naive UTC, as google-auth stores it
+        if self.credentials.token and expiry and expiry - datetime.now(timezone.utc).replace(tzinfo=None) > margin:
+            return False
+        self.credentials.refresh(self._auth_request)
+        self.token_refreshes += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Requests sent vs. connections opened (TLS handshakes) across the pool."""
+        pools = self._adapter.poolmanager.pools
+        requests_sent = connections = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "connections": connections,
+            "reused": max(0, requests_sent - connections),
+            "token_refreshes": self.token_refreshes,
+        }
+
+    def close(self):
+        self.session.close()
+        self._token_session.close()
+
+class SheetRowIndex:
+    """
+    Discord_ID -> row number for one tab. Built from a single column read
+    and then kept in step with the bot's own appends and deletes, so writes
+    can address their row directly instead of calling find().
+    """
+    def __init__(self):
+        self._rows: Dict[str, int] = {}
+        self.next_row: Optional[int] = None # Row the next append lands on; None = not built
+
+    @property
+    def built(self) -> bool:
+        return self.next_row is not None
+
+    def build(self, column: list):
+        """Indexes the values of column A (header included). The first match wins, like find()."""
+        rows: Dict[str, int] = {}
+        for i, value in enumerate(column[1:], start=2):
+            if value != "":
+                rows.setdefault(str(value), i)
+        self._rows = rows
+        self.next_row = max(len(column), 1) + 1
+
+    def invalidate(self):
+        self._rows = {}
+        self.next_row = None
+
+    def get(self, user_id: str) -> Optional[int]:
+        return self._rows.get(user_id)
+
+    def appended(self, user_ids: List[str], first_row: int):
+        if not self.built:
+            return # Invalidated meanwhile; a partial index would hide every other row
+        for offset, user_id in enumerate(user_ids):
+            self._rows.setdefault(user_id, first_row + offset)
+        self.next_row = first_row + len(user_ids)
+
+    def deleted(self, row: int):
+        """Drops the entry at `row` and shifts every row below it up by one."""
+        self._rows = {uid: (r - 1 if r > row else r) for uid, r in self._rows.items() if r != row}
+        self.next_row -= 1
+
+def first_row_of(a1_range: str) -> Optional[int]:
+    """Returns the starting row of an A1 range such as "SangSignups!A12:I14"."""
+    match = re.search(r'![A-Z]+(\d+)', a1_range or "")
+    return int(match.group(1)) if match else None
+
+# ---------------------------
+# 🔹 Local Signup Store
+# ---------------------------
+
+# SQLite column for each sheet header, in sheet order
+STORE_COLUMNS = ["discord_id", "discord_name", "favorite_roles", "kc", "has_scythe", "proficiency", "learning_freeze", "mentor_request", "timestamp"]
+STORE_BOOL_COLUMNS = {"has_scythe", "learning_freeze", "mentor_request"}
+STORE_TABLES = {SANG_SHEET_TAB_NAME: "signups", SANG_HISTORY_TAB_NAME: "history"}
+CLEAR_ALL_ID = "*" # Outbox key for a whole-tab clear
+
+def data_path(env_var: str, filename: str, persistent: bool = False) -> Path:
+    """
+    Resolves a file on the bot's data volume: the path in `env_var` if set,
+    else `filename` under SANG_EXPORT_DIR, falling back to /tmp like exports do.
+    With `persistent`, the /tmp fallback raises instead: that file must survive restarts.
+    """
+    explicit = os.getenv(env_var)
+    if explicit:
+        path = Path(explicit)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+    data_dir = Path(os.getenv("SANG_EXPORT_DIR", "/mnt/data"))
+    try:
+        data_dir.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        if persistent:
+            raise RuntimeError(f"{data_dir} is not writable ({e}) and {env_var} is not set; "
+                               f"point {env_var} at a persistent volume for {filename}.") from e
+        data_dir = Path("/tmp")
+        data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir / filename
+
+def on_ephemeral_storage(path: Path) -> bool:
+    """True if a file at `path` is lost on restart or deploy: anything under /tmp, or anywhere on a Heroku dyno."""
+    return bool(os.getenv("DYNO")) or Path("/tmp").resolve() in path.resolve().parents
+
+class SignupStore:
+    """
+    SQLite copy of SangSignups and History that every handler reads and
+    writes. Google Sheets is a replica: each change is recorded in an
+    outbox table that the cog's replicator drains in the background.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.db = sqlite3.connect(str(path))
+        self.db.row_factory = sqlite3.Row
+        columns = ", ".join(f"{c} {'INTEGER' if c in STORE_BOOL_COLUMNS else ''}".strip() for c in STORE_COLUMNS[1:])
+        with self.db:
+            for table in STORE_TABLES.values():
+                self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} (discord_id TEXT PRIMARY KEY, {columns})")
+            # One pending change per (tab, user); `version` lets a replicator ack only what it actually sent
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_outbox ("
+                "tab TEXT NOT NULL, discord_id TEXT NOT NULL, op TEXT NOT NULL, version INTEGER NOT NULL, "
+                "PRIMARY KEY (tab, discord_id))"
+            )
+
+    # --- Conversions ---
+
+    @staticmethod
+    def _to_db(row_data: list) -> list:
+        values = list(row_data)
+        values[0] = str(values[0])
+        for i, column in enumerate(STORE_COLUMNS):
+            if column in STORE_BOOL_COLUMNS:
+                values[i] = int(bool(values[i]))
+        return values
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict[str, Any]:
+        """Shapes a DB row like a get_all_records() dict, with real booleans."""
+        return {
+            header: (bool(row[column]) if column in STORE_BOOL_COLUMNS else row[column])
+            for header, column in zip(SANG_SHEET_HEADER, STORE_COLUMNS)
+        }
+
+    @staticmethod
+    def _to_sheet_row(row: sqlite3.Row) -> list:
+        return [bool(row[c]) if c in STORE_BOOL_COLUMNS else row[c] for c in STORE_COLUMNS]
+
+    @staticmethod
+    def _from_sheet_record(record: Dict[str, Any]) -> Optional[list]:
+        discord_id = record.get("Discord_ID")
+        if discord_id is None or discord_id == "":
+            return None
+        values = []
+        for header, column in zip(SANG_SHEET_HEADER, STORE_COLUMNS):
+            value = record.get(header, "")
+            # Convert GSheet "TRUE"/"FALSE" strings to real booleans
+            values.append(int(str(value).upper() == "TRUE") if column in STORE_BOOL_COLUMNS else value)
+        values[0] = str(discord_id)
+        return values
+
+    def _mark(self, tab: str, discord_id: str, op: str):
+        self.db.execute(
+            "INSERT INTO sheet_outbox (tab, discord_id, op, version) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (tab, discord_id) DO UPDATE SET op = excluded.op, version = version + 1",
+            (tab, discord_id, op),
+        )
+
+    # --- Signup writes ---
+
+    def upsert_signup(self, row_data: list):
+        """Saves a signup to both tables and queues it for both tabs."""
+        values = self._to_db(row_data)
+        placeholders = ", ".join("?" for _ in STORE_COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in STORE_COLUMNS[1:])
+        with self.db:
+            for tab, table in STORE_TABLES.items():
+                self.db.execute(
+                    f"INSERT INTO {table} ({', '.join(STORE_COLUMNS)}) VALUES ({placeholders}) "
+                    f"ON CONFLICT (discord_id) DO UPDATE SET {updates}",
+                    values,
+                )
+                self._mark(tab, values[0], "upsert")
+
+    def withdraw(self, user_id: str) -> bool:
+        """Removes a user from this week's signups. Returns False if they were not signed up."""
+        with self.db:
+            deleted = self.db.execute("DELETE FROM signups WHERE discord_id = ?", (user_id,)).rowcount
+            if deleted:
+                self._mark(SANG_SHEET_TAB_NAME, user_id, "delete")
+        return bool(deleted)
+
+    def clear_signups(self):
+        """Empties this week's signups. Pending per-user changes are replaced by one tab clear."""
+        with self.db:
+            self.db.execute("DELETE FROM signups")
+            self.db.execute("DELETE FROM sheet_outbox WHERE tab = ?", (SANG_SHEET_TAB_NAME,))
+            self._mark(SANG_SHEET_TAB_NAME, CLEAR_ALL_ID, "clear")
+
+    # --- Reads ---
+
+    def signup_records(self) -> List[Dict[str, Any]]:
+        """All current signups in signup order, shaped like get_all_records()."""
+        return [self._to_record(r) for r in self.db.execute("SELECT * FROM signups ORDER BY rowid")]
+
+    def signup_values(self) -> List[list]:
+        """All current signups in signup order, shaped like get_all_values() (header row first)."""
+        return [SANG_SHEET_HEADER] + [self._to_sheet_row(r) for r in self.db.execute("SELECT * FROM signups ORDER BY rowid")]
+
+    def history_records(self) -> List[Dict[str, Any]]:
+        """Every History row, shaped like get_all_records()."""
+        return [self._to_record(r) for r in self.db.execute("SELECT * FROM history")]
+
+    def get_history(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute("SELECT * FROM history WHERE discord_id = ?", (user_id,)).fetchone()
+        return self._to_record(row) if row else None
+
+    def count(self, tab: str) -> int:
+        return self.db.execute(f"SELECT COUNT(*) FROM {STORE_TABLES[tab]}").fetchone()[0]
+
+    # --- Replication ---
+
+    def pending_changes(self, tab: str) -> List[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM sheet_outbox WHERE tab = ?", (tab,)).fetchall()
+
+    def sheet_rows(self, tab: str, user_ids: List[str]) -> Dict[str, list]:
+        """Current sheet-ordered rows for the given users (missing users are skipped)."""
+        if not user_ids:
+            return {}
+        marks = ", ".join("?" for _ in user_ids)
+        rows = self.db.execute(f"SELECT * FROM {STORE_TABLES[tab]} WHERE discord_id IN ({marks})", user_ids)
+        return {r["discord_id"]: self._to_sheet_row(r) for r in rows}
+
+    def ack(self, changes: List[sqlite3.Row]):
+        """Clears replicated changes, unless the user changed again since they were read."""
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM sheet_outbox WHERE tab = ? AND discord_id = ? AND version = ?",
+                [(c["tab"], c["discord_id"], c["version"]) for c in changes],
+            )
+
+    def import_records(self, tab: str, records: List[Dict[str, Any]]) -> int:
+        """
+        Replaces a table with a sheet snapshot, keeping local rows that have
+        not been replicated yet. Returns the number of rows imported.
+        """
+        table = STORE_TABLES[tab]
+        pending = {c["discord_id"] for c in self.pending_changes(tab)}
+        if CLEAR_ALL_ID in pending:
+            return 0 # The sheet still holds rows we already cleared locally
+        rows = {}
+        for record in records:
+            values = self._from_sheet_record(record)
+            if values and values[0] not in pending:
+                rows[values[0]] = values # Later rows win
+        placeholders = ", ".join("?" for _ in STORE_COLUMNS)
+        with self.db:
+            if pending:
+                marks = ", ".join("?" for _ in pending)
+                self.db.execute(f"DELETE FROM {table} WHERE discord_id NOT IN ({marks})", list(pending))
+            else:
+                self.db.execute(f"DELETE FROM {table}")
+            self.db.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", list(rows.values()))
+        return len(rows)
+
+    def close(self):
+        self.db.close()
+
+class TeamRunStore:
+    """
+    Every /sangmatch and /sangmatchtest result, persisted in the store's
+    database so exports survive restarts. Only the newest `retention`
+    runs are kept.
+    """
+    def __init__(self, db: sqlite3.Connection, retention: int = TEAM_RUN_RETENTION):
+        self.db = db
+        self.retention = retention
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS team_runs ("
+                "run_id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL, command TEXT NOT NULL, "
+                "source TEXT NOT NULL, source_channel_id TEXT, params TEXT NOT NULL, teams TEXT NOT NULL, stranded TEXT NOT NULL)"
+            )
+
+    @staticmethod
+    def _dump(value) -> str:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+    def save(self, command: str, source: str, source_channel_id: Optional[int], params: Dict[str, Any],
+             teams: List[List[Dict[str, Any]]], stranded: List[Dict[str, Any]]) -> int:
+        """Stores a run and prunes old ones. Returns the new run id."""
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO team_runs (created_at, command, source, source_channel_id, params, teams, stranded) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now(CST).isoformat(timespec="seconds"), command, source,
+                 str(source_channel_id) if source_channel_id else None,
+                 self._dump(params), self._dump(teams), self._dump(stranded)),
+            )
+            self.db.execute(
+                "DELETE FROM team_runs WHERE run_id NOT IN (SELECT run_id FROM team_runs ORDER BY run_id DESC LIMIT ?)",
+                (self.retention,),
+            )
+        return cursor.lastrowid
+
+    def get(self, run_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Loads one run by id, or the most recent run when `run_id` is None."""
+        if run_id is None:
+            row = self.db.execute("SELECT * FROM team_runs ORDER BY run_id DESC LIMIT 1").fetchone()
+        else:
+            row = self.db.execute("SELECT * FROM team_runs WHERE run_id = ?", (run_id,)).fetchone()
+        return self._load(row)
+
+    def latest(self, command: str, source_channel_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Loads the newest run of `command` for the same source voice channel (None = all signups)."""
+        row = self.db.execute(
+            "SELECT * FROM team_runs WHERE command = ? AND source_channel_id IS ? ORDER BY run_id DESC LIMIT 1",
+            (command, str(source_channel_id) if source_channel_id else None),
+        ).fetchone()
+        return self._load(row)
+
+    @staticmethod
+    def _load(row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        run = dict(row)
+        for key in ("params", "teams", "stranded"):
+            run[key] = json.loads(run[key])
+        return run
+
+    def recent_ids(self, limit: int = 10) -> List[int]:
+        return [r[0] for r in self.db.execute("SELECT run_id FROM team_runs ORDER BY run_id DESC LIMIT ?", (limit,))]
+
+class PostedMessageStore:
+    """
+    IDs of the signup and reminder messages the bot posted, per channel, so
+    stale ones can be deleted or edited directly instead of scanning history.
+    """
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS posted_messages ("
+                "message_id TEXT PRIMARY KEY, kind TEXT NOT NULL, channel_id TEXT NOT NULL, "
+                "posted_at TEXT NOT NULL, content_hash TEXT NOT NULL DEFAULT '', mentions TEXT)"
+            )
+            columns = {r["name"] for r in self.db.execute("PRAGMA table_info(posted_messages)")}
+            if "mentions" not in columns:
+                self.db.execute("ALTER TABLE posted_messages ADD COLUMN mentions TEXT")
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @staticmethod
+    def mentions_in(content: str) -> List[str]:
+        return re.findall(r"<@!?(\d+)>", content)
+
+    def add(self, kind: str, channel_id: int, message_id: int, content: str = "") -> None:
+        """Tracks a message; the users it mentions are recorded since only its posting notifies them."""
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO posted_messages (message_id, kind, channel_id, posted_at, content_hash, mentions) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(message_id), kind, str(channel_id), datetime.now(CST).isoformat(timespec="seconds"),
+                 self.content_hash(content), " ".join(self.mentions_in(content))),
+            )
+
+    def pinged(self, messages: List[Dict[str, Any]]) -> Optional[set]:
+        """User IDs notified by these tracked messages, or None if any was tracked before mentions were recorded."""
+        if any(m["mentions"] is None for m in messages):
+            return None
+        return {uid for m in messages for uid in m["mentions"].split()}
+
+    def list(self, kind: str, channel_id: int) -> List[Dict[str, Any]]:
+        """Tracked messages of one kind in a channel, oldest first."""
+        rows = self.db.execute(
+            "SELECT * FROM posted_messages WHERE kind = ? AND channel_id = ?", (kind, str(channel_id))
+        ).fetchall()
+        return sorted((dict(r, message_id=int(r["message_id"])) for r in rows), key=lambda r: r["message_id"])
+
+    def set_content(self, message_id: int, content: str) -> None:
+        """Records an edit. Mentions are left alone: edits don't notify anyone."""
+        with self.db:
+            self.db.execute("UPDATE posted_messages SET content_hash = ? WHERE message_id = ?", (self.content_hash(content), str(message_id)))
+
+    def remove(self, message_ids: List[int]) -> None:
+        with self.db:
+            self.db.executemany("DELETE FROM posted_messages WHERE message_id = ?", [(str(i),) for i in message_ids])
+
+# ---------------------------
+# 🔹 Voice Channel Provisioning
+# ---------------------------
+
+class ChannelRegistry:
+    """
+    IDs of every team voice channel the bot created or reused, stored in
+    the signup database so /sangcleanup still knows them after a restart.
+    """
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS team_channels ("
+                "channel_id TEXT PRIMARY KEY, guild_id TEXT NOT NULL, name TEXT NOT NULL, created_at TEXT NOT NULL)"
+            )
+
+    def add(self, channels) -> None:
+        now = datetime.now(CST).isoformat(timespec="seconds")
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO team_channels (channel_id, guild_id, name, created_at) VALUES (?, ?, ?, ?)",
+                [(str(c.id), str(c.guild.id), c.name, now) for c in channels],
+            )
+
+    def ids(self, guild_id: int) -> List[int]:
+        return [int(r[0]) for r in self.db.execute("SELECT channel_id FROM team_channels WHERE guild_id = ?", (str(guild_id),))]
+
+    def remove(self, channel_ids: List[int]) -> None:
+        with self.db:
+            self.db.executemany("DELETE FROM team_channels WHERE channel_id = ?", [(str(i),) for i in channel_ids])
+
+class ChannelProvisioner:
+    """
+    Makes sure "SanguineSunday – Team N" voice channels exist for a run.
+    Channels already in the category are reused; only missing ones are
+    created, concurrently but never more than `concurrency` at a time.
+    discord.py already waits out 429s per rate-limit bucket; the semaphore
+    keeps a big event from queueing dozens of requests against one bucket.
+    Every channel handed out is recorded in the registry for cleanup.
+    """
+    def __init__(self, registry: ChannelRegistry, concurrency: int = VC_CONCURRENCY):
+        self.registry = registry
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @staticmethod
+    def team_number(channel) -> Optional[int]:
+        match = re.fullmatch(re.escape(TEAM_VC_PREFIX) + r"(\d+)", channel.name)
+        return int(match.group(1)) if match else None
+
+    async def _create(self, category, number: int):
+        async with self._semaphore:
+            return await category.create_voice_channel(name=f"{TEAM_VC_PREFIX}{number}", user_limit=5)
+
+    async def provision(self, category, team_count: int) -> Dict[int, discord.VoiceChannel]:
+        """Returns {team number (1-based): voice channel} for teams 1..team_count."""
+        channels: Dict[int, discord.VoiceChannel] = {}
+        for channel in category.voice_channels:
+            number = self.team_number(channel)
+            if number and number <= team_count and number not in channels:
+                channels[number] = channel
+        missing = [n for n in range(1, team_count + 1) if n not in channels]
+        results = await asyncio.gather(*(self._create(category, n) for n in missing), return_exceptions=True)
+        for number, result in zip(missing, results):
+            if isinstance(result, Exception):
+                print(f"⚠️ Error creating VC for Team {number}: {result}")
+            else:
+                channels[number] = result
+        self.registry.add(channels.values())
+        print(f"✅ Team VCs ready: reused {team_count - len(missing)}, created {sum(not isinstance(r, Exception) for r in results)}.")
+        return channels
+
+    async def _delete(self, guild: discord.Guild, channel_id: int) -> bool:
+        """Deletes one registered channel, retrying on 429. A channel that is already gone counts as deleted."""
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            return True
+        for attempt in range(VC_DELETE_RETRIES):
+            async with self._semaphore:
+                try:
+                    await channel.delete(reason="sangcleanup")
+                    return True
+                except discord.NotFound:
+                    return True
+                except discord.HTTPException as e:
+                    if e.status != 429 or attempt == VC_DELETE_RETRIES - 1:
+                        print(f"⚠️ Could not delete VC {channel.name}: {e}")
+                        return False
+                    retry_after = getattr(e, "retry_after", None) or 2 ** attempt
+            await asyncio.sleep(retry_after) # Back off outside the semaphore
+
+    async def cleanup(self, guild: discord.Guild):
+        """Deletes every registered team channel concurrently. Returns (deleted, failed, seconds)."""
+        start = time.perf_counter()
+        channel_ids = self.registry.ids(guild.id)
+        results = await asyncio.gather(*(self._delete(guild, i) for i in channel_ids))
+        deleted = [i for i, ok in zip(channel_ids, results) if ok]
+        self.registry.remove(deleted)
+        return len(deleted), len(channel_ids) - len(deleted), time.perf_counter() - start
+
+    async def _move(self, member: discord.Member, channel) -> bool:
+        async with self._semaphore:
+            try:
+                await member.move_to(channel, reason="Sanguine Sunday teams")
+                return True
+            except discord.HTTPException as e:
+                print(f"⚠️ Could not move {member} to {channel.name}: {e}")
+                return False
+
+    async def move_players(self, guild: discord.Guild, teams: List[List[Dict[str, Any]]],
+                           channels: Dict[int, discord.VoiceChannel]) -> int:
+        """Moves every raider who is connected to voice into their team's channel. Returns how many moved."""
+        moves = []
+        for number, team in enumerate(teams, start=1):
+            channel = channels.get(number)
+            if channel is None:
+                continue
+            for p in team:
+                member = guild.get_member(int(p["user_id"])) if str(p.get("user_id", "")).isdigit() else None
+                if member and member.voice and member.voice.channel and member.voice.channel.id != channel.id:
+                    moves.append(self._move(member, channel))
+        return sum(await asyncio.gather(*moves))
 
 # ---------------------------
 # 🔹 UI Modals & Views
@@ -382,23 +2167,20 @@ class UserSignupForm(Modal, title="Sanguine Sunday Signup"):
             self.has_scythe.default = "Yes" if previous_data.get("Has_Scythe", False) else "No"
             self.learning_freeze.default = "Yes" if previous_data.get("Learning Freeze", False) else ""
 
+    @instrumented("modal")
+    @deadline_guard()
     async def on_submit(self, interaction: discord.Interaction):
-        # Use self.cog.sang_sheet and self.cog.history_sheet
-        if not self.cog.sang_sheet:
-            await interaction.response.send_message("⚠️ Error: The Sanguine Sunday signup sheet is not connected. Please contact staff.", ephemeral=True)
-            return
-        
         # --- Validation ---
         try:
             kc_value = int(str(self.kc))
             if kc_value < 0: raise ValueError("KC cannot be negative.")
         except ValueError:
-            await interaction.response.send_message("⚠️ Error: Kill Count must be a valid number.", ephemeral=True)
+            await reply(interaction, "⚠️ Error: Kill Count must be a valid number.", ephemeral=True)
             return
         
         scythe_value = str(self.has_scythe).strip().lower()
         if scythe_value not in ["yes", "no", "y", "n"]:
-            await interaction.response.send_message("⚠️ Error: Scythe must be 'Yes' or 'No'.", ephemeral=True)
+            await reply(interaction, "⚠️ Error: Scythe must be 'Yes' or 'No'.", ephemeral=True)
             return
         has_scythe_bool = scythe_value in ["yes", "y"]
 
@@ -421,43 +2203,15 @@ class UserSignupForm(Modal, title="Sanguine Sunday Signup"):
         row_data = [user_id, user_name, roles_known_value, kc_value, has_scythe_bool, proficiency_value, learning_freeze_bool, False, timestamp]
         
         try:
-            # --- Write to SangSignups sheet ---
-            cell = self.cog.sang_sheet.find(user_id, in_column=1)
-            if cell is None:
-                self.cog.sang_sheet.append_row(row_data) # New signup
-            else:
-                self.cog.sang_sheet.update(values=[row_data], range_name=f'A{cell.row}:I{cell.row}') # Update existing
-
-            # --- Write to History sheet ---
-            if self.cog.history_sheet:
-                try:
-                    history_cell = self.cog.history_sheet.find(user_id, in_column=1)
-                    if history_cell is None:
-                        self.cog.history_sheet.append_row(row_data)
-                    else:
-                        self.cog.history_sheet.update(values=[row_data], range_name=f'A{history_cell.row}:I{history_cell.row}')
-                except Exception as e:
-                    print(f"🔥 GSpread error on HISTORY (User Form) write: {e}")
-            else:
-                print("🔥 History sheet not available, skipping history append.")
-
-        except gspread.CellNotFound:
-             # Fallback if find() fails but user isn't there
-             self.cog.sang_sheet.append_row(row_data)
-             if self.cog.history_sheet:
-                try:
-                    history_cell = self.cog.history_sheet.find(user_id, in_column=1)
-                    if history_cell is None: self.cog.history_sheet.append_row(row_data)
-                    else: self.cog.history_sheet.update(values=[row_data], range_name=f'A{history_cell.row}:I{history_cell.row}')
-                except Exception as e: print(f"🔥 GSpread error on HISTORY (User Form) write: {e}")
-             else: print("🔥 History sheet not available, skipping history append.")
+            self.cog.save_signup(row_data)
         except Exception as e:
-            print(f"🔥 GSpread error on signup: {e}")
-            await interaction.response.send_message("⚠️ An error occurred while saving your signup.", ephemeral=True)
+            print(f"🔥 Store error on signup: {e}")
+            await reply(interaction, "⚠️ An error occurred while saving your signup.", ephemeral=True)
             return
 
         # --- Success Message ---
-        await interaction.response.send_message(
+        await reply(
+            interaction,
             f"✅ **You are signed up as {proficiency_value}!**\n"
             f"**KC:** {kc_value}\n"
             f"**Scythe:** {'Yes' if has_scythe_bool else 'No'}\n"
@@ -482,25 +2236,22 @@ class MentorSignupForm(Modal, title="Sanguine Sunday Mentor Signup"):
              self.kc.default = str(kc_val) if kc_val not in ["", None, "X"] else ""
              self.has_scythe.default = "Yes" if previous_data.get("Has_Scythe", False) else "No"
 
+    @instrumented("modal")
+    @deadline_guard()
     async def on_submit(self, interaction: discord.Interaction):
-        # Use self.cog.sang_sheet and self.cog.history_sheet
-        if not self.cog.sang_sheet:
-            await interaction.response.send_message("⚠️ Error: The Sanguine Sunday signup sheet is not connected.", ephemeral=True)
-            return
-        
         # --- Validation ---
         try:
             kc_value = int(str(self.kc))
             if kc_value < 50:
-                await interaction.response.send_message("⚠️ Mentors should have 50+ KC to sign up via form.", ephemeral=True)
+                await reply(interaction, "⚠️ Mentors should have 50+ KC to sign up via form.", ephemeral=True)
                 return
         except ValueError:
-            await interaction.response.send_message("⚠️ Error: Kill Count must be a valid number.", ephemeral=True)
+            await reply(interaction, "⚠️ Error: Kill Count must be a valid number.", ephemeral=True)
             return
         
         scythe_value = str(self.has_scythe).strip().lower()
         if scythe_value not in ["yes", "no", "y", "n"]:
-            await interaction.response.send_message("⚠️ Error: Scythe must be 'Yes' or 'No'.", ephemeral=True)
+            await reply(interaction, "⚠️ Error: Scythe must be 'Yes' or 'No'.", ephemeral=True)
             return
         has_scythe_bool = scythe_value in ["yes", "y"]
 
@@ -517,42 +2268,15 @@ class MentorSignupForm(Modal, title="Sanguine Sunday Mentor Signup"):
         row_data = [user_id, user_name, roles_known_value, kc_value, has_scythe_bool, proficiency_value, learning_freeze_bool, False, timestamp]
         
         try:
-            # --- Write to SangSignups sheet ---
-            cell = self.cog.sang_sheet.find(user_id, in_column=1)
-            if cell is None:
-                self.cog.sang_sheet.append_row(row_data) # New signup
-            else:
-                self.cog.sang_sheet.update(values=[row_data], range_name=f'A{cell.row}:I{cell.row}') # Update existing
-
-            # --- Write to History sheet ---
-            if self.cog.history_sheet:
-                try:
-                    history_cell = self.cog.history_sheet.find(user_id, in_column=1)
-                    if history_cell is None:
-                        self.cog.history_sheet.append_row(row_data)
-                    else:
-                        self.cog.history_sheet.update(values=[row_data], range_name=f'A{history_cell.row}:I{history_cell.row}')
-                except Exception as e:
-                    print(f"🔥 GSpread error on HISTORY (Mentor Form) write: {e}")
-            else:
-                print("🔥 History sheet not available, skipping history append.")
-        except gspread.CellNotFound:
-             # Fallback if find() fails but user isn't there
-            self.cog.sang_sheet.append_row(row_data)
-            if self.cog.history_sheet:
-                try:
-                    history_cell = self.cog.history_sheet.find(user_id, in_column=1)
-                    if history_cell is None: self.cog.history_sheet.append_row(row_data)
-                    else: self.cog.history_sheet.update(values=[row_data], range_name=f'A{history_cell.row}:I{history_cell.row}')
-                except Exception as e: print(f"🔥 GSpread error on HISTORY (Mentor Form) write: {e}")
-            else: print("🔥 History sheet not available, skipping history append.")
+            self.cog.save_signup(row_data)
         except Exception as e:
-            print(f"🔥 GSpread error on mentor signup: {e}")
-            await interaction.response.send_message("⚠️ An error occurred while saving your signup.", ephemeral=True)
+            print(f"🔥 Store error on signup: {e}")
+            await reply(interaction, "⚠️ An error occurred while saving your signup.", ephemeral=True)
             return
 
         # --- Success Message ---
-        await interaction.response.send_message(
+        await reply(
+            interaction,
             f"✅ **You are signed up as a Mentor!**\n"
             f"**KC:** {kc_value}\n"
             f"**Scythe:** {'Yes' if has_scythe_bool else 'No'}\n"
@@ -566,27 +2290,22 @@ class WithdrawalButton(ui.Button):
         super().__init__(label="Withdraw", style=ButtonStyle.secondary, custom_id="sang_withdraw", emoji="❌")
         self.cog = cog # Store the cog instance
 
+    @instrumented("button")
+    @deadline_guard()
     async def callback(self, interaction: discord.Interaction):
         user_id = str(interaction.user.id)
         user_name = interaction.user.display_name
 
-        if not self.cog.sang_sheet:
-            await interaction.response.send_message("⚠️ Error: The Sanguine Signup sheet is not connected.", ephemeral=True)
-            return
-
         try:
-            # Use self.cog.sang_sheet
-            cell = self.cog.sang_sheet.find(user_id, in_column=1)
-            if cell is None:
-                await interaction.response.send_message(f"ℹ️ {user_name}, you are not currently signed up for this week's event.", ephemeral=True)
+            if not self.cog.withdraw_signup(user_id):
+                await reply(interaction, f"ℹ️ {user_name}, you are not currently signed up for this week's event.", ephemeral=True)
                 return
             
-            self.cog.sang_sheet.delete_rows(cell.row)
-            await interaction.response.send_message(f"✅ **{user_name}**, you have been successfully withdrawn from this week's Sanguine Sunday signups.", ephemeral=True)
+            await reply(interaction, f"✅ **{user_name}**, you have been successfully withdrawn from this week's Sanguine Sunday signups.", ephemeral=True)
             print(f"✅ User {user_id} ({user_name}) withdrew from SangSignups.")
         except Exception as e:
-            print(f"🔥 GSpread error on withdrawal: {e}")
-            await interaction.response.send_message("⚠️ An error occurred while processing your withdrawal.", ephemeral=True)
+            print(f"🔥 Store error on withdrawal: {e}")
+            await reply(interaction, "⚠️ An error occurred while processing your withdrawal.", ephemeral=True)
 
 class SignupView(View):
     """The persistent view with the 3 main buttons: Raider, Mentor, Withdraw."""
@@ -596,18 +2315,22 @@ class SignupView(View):
         self.add_item(WithdrawalButton(self.cog))
 
     @ui.button(label="Sign Up as Raider", style=ButtonStyle.success, custom_id="sang_signup_raider", emoji="📝")
+    @instrumented("button")
     async def user_signup_button(self, interaction: discord.Interaction, button: Button):
         # Call the cog's method to get previous data
         previous_data = self.cog.get_previous_signup(str(interaction.user.id))
         # Pass the cog instance to the modal
         await interaction.response.send_modal(UserSignupForm(self.cog, previous_data=previous_data))
+        record_first_response(interaction)
 
     @ui.button(label="Sign Up as Mentor", style=ButtonStyle.danger, custom_id="sang_signup_mentor", emoji="🎓")
+    @instrumented("button")
     async def mentor_signup_button(self, interaction: discord.Interaction, button: Button):
         user = interaction.user
         member = interaction.guild.get_member(user.id)
         if not member:
              await interaction.response.send_message("⚠️ Could not verify your roles. Please try again.", ephemeral=True)
+             record_first_response(interaction)
              return
 
         has_mentor_role = any(role.id == MENTOR_ROLE_ID for role in member.roles)
@@ -616,6 +2339,7 @@ class SignupView(View):
         if not has_mentor_role:
             # User does NOT have @Mentor role, send them the Mentor form
             await interaction.response.send_modal(MentorSignupForm(self.cog, previous_data=previous_data))
+            record_first_response(interaction)
             return
         
         # User HAS @Mentor role, check for auto-signup
@@ -625,9 +2349,7 @@ class SignupView(View):
             # This is a Mentor's first-time click, or they've filled out the form before.
             # Auto-sign them up with default values.
             await interaction.response.defer(ephemeral=True)
-            if not self.cog.sang_sheet or not self.cog.history_sheet:
-                await interaction.followup.send("⚠️ Error: The Sanguine Sunday signup or history sheet is not connected.", ephemeral=True)
-                return
+            record_first_response(interaction)
 
             user_id = str(user.id)
             user_name = member.display_name
@@ -636,37 +2358,17 @@ class SignupView(View):
             row_data = [user_id, user_name, "All", "X", True, "Mentor", False, False, timestamp]
 
             try:
-                cell = self.cog.sang_sheet.find(user_id, in_column=1)
-                if cell is None: self.cog.sang_sheet.append_row(row_data)
-                else: self.cog.sang_sheet.update(values=[row_data], range_name=f'A{cell.row}:I{cell.row}')
-
-                if self.cog.history_sheet:
-                    try:
-                        history_cell = self.cog.history_sheet.find(user_id, in_column=1)
-                        if history_cell is None: self.cog.history_sheet.append_row(row_data)
-                        else: self.cog.history_sheet.update(values=[row_data], range_name=f'A{history_cell.row}:I{history_cell.row}')
-                    except Exception as e: print(f"🔥 GSpread error on HISTORY (Auto-Mentor) write: {e}")
-                else: print("🔥 History sheet not available, skipping history append.")
-                
+                self.cog.save_signup(row_data)
                 await interaction.followup.send("✅ **Auto-signed up as Mentor!**\nTo edit your KC/Scythe/Roles, click the 'Mentor' button again.", ephemeral=True)
-            except gspread.CellNotFound:
-                 self.cog.sang_sheet.append_row(row_data)
-                 if self.cog.history_sheet:
-                    try:
-                        history_cell = self.cog.history_sheet.find(user_id, in_column=1)
-                        if history_cell is None: self.cog.history_sheet.append_row(row_data)
-                        else: self.cog.history_sheet.update(values=[row_data], range_name=f'A{history_cell.row}:I{history_cell.row}')
-                    except Exception as e: print(f"🔥 GSpread error on HISTORY (Auto-Mentor) write: {e}")
-                 else: print("🔥 History sheet not available, skipping history append.")
-                 await interaction.followup.send("✅ **Auto-signed up as Mentor!**\nTo edit your KC/Scythe/Roles, click the 'Mentor' button again.", ephemeral=True)
             except Exception as e:
-                print(f"🔥 GSpread error on auto mentor signup: {e}")
+                print(f"🔥 Store error on auto mentor signup: {e}")
                 await interaction.followup.send("⚠️ An error occurred while auto-signing you up.", ephemeral=True)
         else:
             # Mentor has already auto-signed up (KC="X").
             # Send them the form to let them edit their info.
             previous_data["KC"] = "" # Clear the "X"
             await interaction.response.send_modal(MentorSignupForm(self.cog, previous_data=previous_data))
+            record_first_response(interaction)
 
 
 # ---------------------------
@@ -682,8 +2384,87 @@ class SanguineCog(commands.Cog):
         self.bot = bot
         self.sang_sheet = None
         self.history_sheet = None
+        self.sheets = SheetGateway() # All Sheets I/O goes through this pool
+        self.store = SignupStore(data_path("SANG_DB_PATH", "sanguine_sunday.db", persistent=REQUIRE_PERSISTENT_DB)) # Primary signup database
+        if on_ephemeral_storage(self.store.path):
+            print(f"⚠️ Signup store {self.store.path} is on ephemeral storage: signups not yet replicated to Sheets "
+                  f"are lost on restart. Set SANG_DB_PATH to a persistent volume.")
+        self.team_runs = TeamRunStore(self.store.db)
+        self.channels = ChannelProvisioner(ChannelRegistry(self.store.db))
+        self.posted = PostedMessageStore(self.store.db)
+        self.history_cache: Dict[str, Dict[str, Any]] = {} # Discord_ID -> History record, for modal-opening buttons
+        self.load_history_cache()
+        self._sheet_write_lock = asyncio.Lock() # Serializes replication with row-shifting edits
+        self.signup_rows = SheetRowIndex()
+        self.history_rows = SheetRowIndex()
+        self.http: Optional[SheetsSession] = None # Pooled session behind the gspread client
+        self.sheets_ready = asyncio.Event() # Set once both tabs are open
+        self._connect_task: Optional[asyncio.Task] = None
+        self._metrics_runner: Optional[web.AppRunner] = None
+        self.last_prewarm: Optional[tuple] = None # (finished_at, label, {step: seconds})
         
-        # Initialize Google Sheets
+        # Add the persistent view
+        # We pass `self` (the cog instance) to the view
+        self.bot.add_view(SignupView(self))
+
+    async def cog_load(self):
+        """Starts the Sheets connection in the background so loading the cog never waits on Google."""
+        self._connect_task = asyncio.create_task(self._connect_sheets())
+        await self.start_metrics_server()
+
+    async def start_metrics_server(self):
+        """Serves Prometheus metrics at /metrics on METRICS_PORT (the web dyno's $PORT by default)."""
+        if not METRICS_PORT:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.metrics_endpoint)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        except OSError as e:
+            print(f"⚠️ Could not start the metrics endpoint on port {METRICS_PORT}: {e}")
+            await runner.cleanup()
+            return
+        self._metrics_runner = runner
+        print(f"✅ Sanguine Cog: Serving metrics on {METRICS_HOST}:{METRICS_PORT}/metrics")
+
+    def sheets_stats(self) -> Dict[str, Dict[str, int]]:
+        """Gateway quota counters and, once connected, HTTP pool counters."""
+        stats = {"sang_sheets_gateway": self.sheets.stats()}
+        if self.http:
+            stats["sang_sheets_http"] = self.http.stats()
+        return stats
+
+    async def metrics_endpoint(self, request: web.Request) -> web.Response:
+        return web.Response(body=metrics.render(self.sheets_stats()).encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def _connect_sheets(self):
+        """Opens the sheet with exponential backoff and jitter until it succeeds, then bootstraps the store."""
+        attempt = 0
+        while not await self.sheets.run(self._open_sheets):
+            delay = min(SHEETS_RETRY_MAX_SECONDS, 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            print(f"⚠️ Sheets connection attempt {attempt} failed; retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+        self.sheets_ready.set()
+        await self.import_from_sheets()
+
+    async def wait_sheets_ready(self, timeout: float = SHEETS_READY_TIMEOUT) -> bool:
+        """Waits up to `timeout` seconds for the Sheets connection. Returns False if it isn't up yet."""
+        if self.sheets_ready.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self.sheets_ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _open_sheets(self) -> bool:
+        """Blocking Sheets setup: auth, open the spreadsheet and verify both tab headers. Returns success."""
+        # Imported here so cold start doesn't pay for gspread/google-auth before the bot is online
+        import gspread
         try:
             scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
             credentials_dict = {
@@ -699,8 +2480,10 @@ class SanguineCog(commands.Cog):
                 "client_x509_cert_url": os.getenv('GOOGLE_CLIENT_X509_CERT_URL'),
                 "universe_domain": os.getenv('GOOGLE_UNIVERSE_DOMAIN'),
             }
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
-            sheet_client = gspread.authorize(creds)
+            if self.http is None:
+                self.http = SheetsSession(credentials_dict, scope)
+                self.http.refresh_if_expiring()
+            sheet_client = self.http.client()
             
             sang_google_sheet = sheet_client.open_by_key(SANG_SHEET_ID)
             
@@ -731,13 +2514,11 @@ class SanguineCog(commands.Cog):
                 self.history_sheet.append_row(SANG_SHEET_HEADER)
             
             print("✅ Sanguine Cog: Google Sheets initialized successfully.")
+            return True
         except Exception as e:
             print(f"🔥 CRITICAL ERROR initializing SanguineCog GSheets: {e}")
-            # Bot will continue, but commands will fail with checks
-
-        # Add the persistent view
-        # We pass `self` (the cog instance) to the view
-        self.bot.add_view(SignupView(self))
+            # Bot will continue on the local store; the connection is retried
+            return False
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -752,84 +2533,382 @@ class SanguineCog(commands.Cog):
         if not self.scheduled_clear_sang_sheet.is_running():
             self.scheduled_clear_sang_sheet.start()
             print("✅ Sanguine Cog: Started scheduled sheet clear task.")
+        if not self.scheduled_replicate.is_running():
+            self.scheduled_replicate.start()
+            print("✅ Sanguine Cog: Started Sheets replicator task.")
+        if not self.scheduled_compact_withdrawals.is_running():
+            self.scheduled_compact_withdrawals.start()
+            print("✅ Sanguine Cog: Started withdrawal compaction task.")
+        if not self.scheduled_import_sheets.is_running():
+            self.scheduled_import_sheets.start()
+            print("✅ Sanguine Cog: Started Sheets import task.")
+        if not self.scheduled_refresh_token.is_running():
+            self.scheduled_refresh_token.start()
+            print("✅ Sanguine Cog: Started Sheets token refresh task.")
+        if PREWARM_MINUTES > 0 and not self.scheduled_prewarm.is_running():
+            self.scheduled_prewarm.start()
+            print(f"✅ Sanguine Cog: Started prewarm task ({PREWARM_MINUTES:g} min before each post).")
+        if AUTO_CLEANUP and not self.scheduled_cleanup_channels.is_running():
+            self.scheduled_cleanup_channels.start()
+            print("✅ Sanguine Cog: Started post-event VC cleanup task.")
         
         print("Sanguine Cog is ready.")
 
+    async def cog_unload(self):
+        """Replicates outstanding changes, stops background tasks and releases the store and Sheets pool."""
+        if self._connect_task:
+            self._connect_task.cancel()
+        self.scheduled_import_sheets.cancel()
+        self.scheduled_replicate.cancel()
+        self.scheduled_compact_withdrawals.cancel()
+        self.scheduled_cleanup_channels.cancel()
+        self.scheduled_refresh_token.cancel()
+        self.scheduled_prewarm.cancel()
+        await self.replicate_to_sheets()
+        await self.compact_withdrawals()
+        self.store.close()
+        self.sheets.shutdown()
+        if self.http:
+            self.http.close()
+        if self._metrics_runner:
+            await self._metrics_runner.cleanup()
+
     # --- Cog Methods (from helper functions) ---
 
-    def get_previous_signup(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Fetches the latest signup data for a user from the HISTORY sheet."""
-        if not self.history_sheet:
-            print("History sheet not available in get_previous_signup.")
-            return None
+    def save_signup(self, row_data: list):
+        """Saves a signup locally; the replicator mirrors it to SangSignups and History."""
+        self.store.upsert_signup(row_data)
+        self.history_cache[str(row_data[0])] = dict(zip(SANG_SHEET_HEADER, [str(row_data[0])] + list(row_data[1:])))
+
+    def withdraw_signup(self, user_id: str) -> bool:
+        """
+        Withdraws a user locally. Their SangSignups row is removed by the next
+        compaction. Returns False if they were not signed up.
+        """
+        return self.store.withdraw(user_id)
+
+    def _replica_tabs(self):
+        return [
+            (SANG_SHEET_TAB_NAME, self.sang_sheet, self.signup_rows),
+            (SANG_HISTORY_TAB_NAME, self.history_sheet, self.history_rows),
+        ]
+
+    @contextlib.asynccontextmanager
+    async def _sheet_writes(self):
+        """Holds the Sheets write lock. A cancelled write may still have landed, so the row indexes are dropped."""
+        async with self._sheet_write_lock:
+            try:
+                yield
+            except asyncio.CancelledError:
+                for _, _, index in self._replica_tabs():
+                    index.invalidate()
+                raise
+
+    async def replicate_to_sheets(self):
+        """Mirrors pending local clears and upserts to Sheets: one batch update and one append per tab."""
+        async with self._sheet_writes():
+            for tab, worksheet, index in self._replica_tabs():
+                changes = self.store.pending_changes(tab)
+                if not changes or not worksheet:
+                    continue
+                clears = [c for c in changes if c["op"] == "clear"]
+                if clears:
+                    try:
+                        await self.sheets.clear(worksheet)
+                        await self.sheets.append_row(worksheet, SANG_SHEET_HEADER)
+                    except Exception as e:
+                        print(f"🔥 GSpread error clearing {tab}: {e}")
+                        continue # Never write rows onto a tab that still holds last week's data
+                    index.build([SANG_SHEET_HEADER[0]])
+                    self.store.ack(clears)
+                    print(f"✅ {tab} sheet cleared and headers added.")
+
+                upserts = [c for c in changes if c["op"] == "upsert"]
+                rows = self.store.sheet_rows(tab, [c["discord_id"] for c in upserts])
+                failed = await self._flush_rows(worksheet, index, rows, tab)
+                self.store.ack([c for c in upserts if c["discord_id"] not in failed])
+
+    async def _locate_rows(self, worksheet, index: SheetRowIndex, user_ids: List[str]) -> Dict[str, int]:
+        """
+        Returns the current row of each user already on the tab. Indexed rows
+        are spot-checked with one batch_get of their ID cells; any mismatch
+        (e.g. someone edited the sheet by hand) triggers a full rebuild.
+        """
+        if index.built:
+            rows = {uid: index.get(uid) for uid in user_ids if index.get(uid) is not None}
+            if not rows:
+                return {}
+            cells = await self.sheets.batch_get(worksheet, [f"A{r}" for r in rows.values()], priority=PRIORITY_BULK)
+            actual = [str(c[0][0]) if c and c[0] else "" for c in cells]
+            if actual == list(rows.keys()):
+                return rows
+            print(f"⚠️ Row index for {worksheet.title} is stale. Rebuilding...")
+        index.build(await self.sheets.col_values(worksheet, 1, priority=PRIORITY_BULK))
+        return {uid: index.get(uid) for uid in user_ids if index.get(uid) is not None}
+
+    async def _flush_rows(self, worksheet, index: SheetRowIndex, rows: Dict[str, list], tab_name: str) -> Dict[str, list]:
+        """Upserts rows into one tab. Returns the rows that could not be written."""
+        if not rows:
+            return {}
+        if not worksheet:
+            print(f"🔥 {tab_name} sheet not available, {len(rows)} pending row(s) kept in queue.")
+            return rows
         try:
-            all_records = self.history_sheet.get_all_records()
-            if not all_records:
-                 print("No records found in history_sheet.")
-                 return None
-            
-            # Iterate in reverse to find the *last* entry for this user
-            for record in reversed(all_records):
-                sheet_discord_id = record.get("Discord_ID")
-                sheet_discord_id_str = str(sheet_discord_id) if sheet_discord_id is not None else None
-                
-                if sheet_discord_id_str == user_id:
-                    # Convert GSheet "TRUE"/"FALSE" strings to real booleans
-                    record["Has_Scythe"] = str(record.get("Has_Scythe", "FALSE")).upper() == "TRUE"
-                    record["Learning Freeze"] = str(record.get("Learning Freeze", "FALSE")).upper() == "TRUE"
-                    return record
-            
-            print(f"No history match found for user_id: {user_id}")
-            return None
+            row_numbers = await self._locate_rows(worksheet, index, list(rows.keys()))
         except Exception as e:
-            print(f"🔥 GSpread error fetching previous signup for {user_id}: {e}")
+            print(f"🔥 GSpread error locating {tab_name} rows for flush: {e}")
+            return rows
+
+        updates = {uid: row for uid, row in rows.items() if uid in row_numbers}
+        appends = {uid: row for uid, row in rows.items() if uid not in row_numbers}
+        failed: Dict[str, list] = {}
+        if updates:
+            data = [{"range": f"A{row_numbers[uid]}:I{row_numbers[uid]}", "values": [row]} for uid, row in updates.items()]
+            try:
+                await self.sheets.batch_update(worksheet, data)
+            except Exception as e:
+                print(f"🔥 GSpread error on {tab_name} batch update: {e}")
+                index.invalidate() # Re-locate before resending in case rows moved meanwhile
+                failed.update(updates)
+        if appends:
+            try:
+                response = await self.sheets.append_rows(worksheet, list(appends.values()))
+                # The API reports where the rows actually landed; trust that over our own count
+                first_row = first_row_of((response or {}).get("updates", {}).get("updatedRange"))
+                if first_row is None:
+                    index.invalidate()
+                else:
+                    index.appended(list(appends.keys()), first_row)
+            except Exception as e:
+                print(f"🔥 GSpread error on {tab_name} append: {e}")
+                index.invalidate() # The append may have landed; rebuild before retrying
+                failed.update(appends)
+        written = len(rows) - len(failed)
+        if written:
+            print(f"✅ Flushed {written} row(s) to {tab_name}.")
+        return failed
+
+    async def compact_withdrawals(self):
+        """Removes every withdrawn user's SangSignups row in one batched request."""
+        async with self._sheet_writes():
+            if not self.sang_sheet:
+                return
+            changes = self.store.pending_changes(SANG_SHEET_TAB_NAME)
+            if any(c["op"] == "clear" for c in changes):
+                return # The replicator wipes the whole tab first
+            deletes = [c for c in changes if c["op"] == "delete"]
+            if not deletes:
+                return
+            try:
+                rows = await self._locate_rows(self.sang_sheet, self.signup_rows, [c["discord_id"] for c in deletes])
+                if rows:
+                    await self.sheets.delete_row_set(self.sang_sheet, list(rows.values()))
+                    for row in sorted(rows.values(), reverse=True):
+                        self.signup_rows.deleted(row)
+            except Exception as e:
+                print(f"🔥 GSpread error compacting withdrawals: {e}")
+                self.signup_rows.invalidate() # Some deletions may have landed; the next run re-locates what's left
+                return
+            self.store.ack(deletes)
+            print(f"✅ Compacted {len(rows)} withdrawn row(s) from {SANG_SHEET_TAB_NAME}.")
+
+    async def import_from_sheets(self, priority: int = PRIORITY_BULK) -> bool:
+        """
+        Bootstraps the local store from both tabs, picking up manual sheet
+        edits. Rows with unreplicated local changes are kept. Returns False
+        if either read failed.
+        """
+        if not await self.wait_sheets_ready():
+            print("⚠️ Sheets not connected yet, keeping local data.")
+            return False
+        ok = True
+        for tab, worksheet, _ in self._replica_tabs():
+            if not worksheet:
+                print(f"{tab} sheet not available, keeping local data.")
+                ok = False
+                continue
+            # Hold the write lock so a replication can't land between our read and the import
+            async with self._sheet_write_lock:
+                try:
+                    records = await self.sheets.get_all_records(worksheet, priority=priority)
+                except Exception as e:
+                    print(f"🔥 GSpread error importing {tab}: {e}")
+                    ok = False
+                    continue
+                imported = self.store.import_records(tab, records)
+            if tab == SANG_HISTORY_TAB_NAME:
+                self.load_history_cache()
+            print(f"✅ Imported {imported} {tab} row(s) into the local store.")
+        return ok
+
+    def load_history_cache(self) -> int:
+        """Loads every History record into memory. Returns the number of records."""
+        self.history_cache = {r["Discord_ID"]: r for r in self.store.history_records()}
+        return len(self.history_cache)
+
+    def get_previous_signup(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a copy of the user's latest signup data from the in-memory
+        History cache. Never touches the database or Sheets: the signup
+        buttons call this right before `send_modal`, which can't be deferred.
+        """
+        record = self.history_cache.get(user_id)
+        if record is None:
+            print(f"No history match found for user_id: {user_id}")
             return None
+        return dict(record)
+
+    async def prewarm(self, label: str) -> Dict[str, float]:
+        """
+        Gets everything the first wave of clicks after a post touches into
+        a warm state: the Sheets token and pooled connection, fresh History
+        and SangSignups snapshots (History also in memory) and both tabs'
+        row indexes. Returns seconds per step.
+        """
+        timings: Dict[str, float] = {}
+        start = step = time.perf_counter()
+        connected = await self.wait_sheets_ready()
+        if connected and self.http:
+            # Good until well after the post, whatever the refresh loop's phase
+            margin = timedelta(minutes=TOKEN_REFRESH_MARGIN_MINUTES + PREWARM_MINUTES)
+            try:
+                await self.sheets.run(self.http.refresh_if_expiring, margin)
+            except Exception as e:
+                print(f"⚠️ Prewarm token refresh failed: {e}")
+        timings["token"] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        if not (connected and await self.import_from_sheets(priority=PRIORITY_STAFF)):
+            self.load_history_cache() # Serve from the local store as it is
+        timings["snapshots"] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        if connected:
+            for tab, worksheet, index in self._replica_tabs():
+                if not worksheet:
+                    continue
+                async with self._sheet_write_lock:
+                    try:
+                        index.build(await self.sheets.col_values(worksheet, 1, priority=PRIORITY_STAFF))
+                    except Exception as e:
+                        print(f"⚠️ Prewarm could not index {tab}: {e}")
+        timings["row_index"] = time.perf_counter() - step
+        timings["total"] = time.perf_counter() - start
+
+        self.last_prewarm = (datetime.now(CST), label, timings)
+        steps = ", ".join(f"{k} {v:.2f}s" for k, v in timings.items() if k != "total")
+        pool = f" HTTP pool: {self.http.stats()}" if self.http else ""
+        print(f"✅ Prewarmed for the {label} post in {timings['total']:.2f}s ({steps}); {len(self.history_cache)} History records cached.{pool}")
+        return timings
+
+    async def delete_posted(self, channel: discord.TextChannel, message_ids: List[int]):
+        """
+        Deletes tracked messages by ID: bulk-deletes those under 14 days old,
+        the rest one by one. Bulk delete needs Manage Messages; without it the
+        bot's own posts are still deleted one by one.
+        """
+        if not message_ids:
+            return
+        cutoff = discord.utils.utcnow() - timedelta(days=13, hours=23)
+        recent = [i for i in message_ids if discord.utils.snowflake_time(i) > cutoff]
+        single = [i for i in message_ids if i not in recent]
+        done = []
+        for start in range(0, len(recent), 100):
+            chunk = recent[start:start + 100]
+            try:
+                await channel.delete_messages([channel.get_partial_message(i) for i in chunk], reason="Stale Sanguine Sunday post")
+                done.extend(chunk)
+            except discord.NotFound:
+                done.extend(chunk)
+            except discord.Forbidden:
+                single.extend(recent[start:]) # No Manage Messages; bulk delete will be refused for every chunk
+                break
+            except discord.HTTPException as e:
+                print(f"⚠️ Could not bulk-delete old posts in #{channel.name}: {e}")
+        for message_id in single:
+            try:
+                await channel.get_partial_message(message_id).delete()
+                done.append(message_id)
+            except discord.NotFound:
+                done.append(message_id)
+            except discord.HTTPException as e:
+                print(f"⚠️ Could not delete old post {message_id} in #{channel.name}: {e}")
+        self.posted.remove(done)
 
     async def post_signup(self, channel: discord.TextChannel):
-        """Posts the main signup message with the signup buttons."""
-        await channel.send(SANG_MESSAGE, view=SignupView(self))
+        """Posts the main signup message with the signup buttons, replacing last week's post in this channel."""
+        stale = [m["message_id"] for m in self.posted.list("signup", channel.id)]
+        message = await channel.send(SANG_MESSAGE, view=SignupView(self))
+        self.posted.add("signup", channel.id, message.id, SANG_MESSAGE)
+        await self.delete_posted(channel, stale)
         print(f"✅ Posted Sanguine Sunday signup in #{channel.name}")
 
     async def post_reminder(self, channel: discord.TextChannel):
-        """Finds learners and posts a reminder."""
-        if not self.sang_sheet:
-            print("⚠️ Cannot post reminder, Sang Sheet not connected.")
-            return False
-        
-        # Delete previous reminder messages
-        try:
-            async for message in channel.history(limit=50):
-                if message.author == self.bot.user and LEARNER_REMINDER_IDENTIFIER in message.content:
-                    await message.delete()
-        except discord.Forbidden:
-            print(f"⚠️ Could not delete old reminders in #{channel.name}")
-        except Exception as e:
-            print(f"🔥 Error cleaning up reminders: {e}")
-
+        """
+        Finds learners and posts a reminder, split over as many messages as the
+        ping list needs. A reminder already posted for the current signup post
+        is edited in place (only the messages whose text changed); edits don't
+        notify anyone, so learners it never pinged get a follow-up ping.
+        Older tracked reminders are deleted by ID.
+        """
         learners = []
         try:
-            all_signups = self.sang_sheet.get_all_records()
+            all_signups = self.store.signup_records()
             for signup in all_signups:
                 proficiency = str(signup.get("Proficiency", "")).lower()
                 if proficiency in ["learner", "new"]:
                     user_id = signup.get('Discord_ID')
                     if user_id:
-                        learners.append(f"<@{user_id}>")
+                        learners.append(str(user_id))
             
             if not learners:
-                reminder_content = f"{LEARNER_REMINDER_MESSAGE}\n\n_No learners have signed up yet._"
+                contents = [f"{LEARNER_REMINDER_MESSAGE}\n\n_No learners have signed up yet._"]
             else:
-                learner_pings = " ".join(learners)
-                reminder_content = f"{LEARNER_REMINDER_MESSAGE}\n\n**Learners:** {learner_pings}"
-
-            await channel.send(reminder_content, allowed_mentions=discord.AllowedMentions(users=True))
-            print(f"✅ Posted Sanguine Sunday learner reminder in #{channel.name}")
-            return True
+                contents = build_ping_messages(LEARNER_REMINDER_MESSAGE, "**Learners:**", [f"<@{uid}>" for uid in learners])
+
+            reminders = self.posted.list("reminder", channel.id) + self.posted.list("reminder_ping", channel.id)
+            signups = self.posted.list("signup", channel.id)
+            latest_signup = signups[-1]["message_id"] if signups else 0
+            current = [r for r in reminders if r["message_id"] > latest_signup]
+            pages = [r for r in current if r["kind"] == "reminder"]
+            mentions = discord.AllowedMentions(users=True)
+
+            if pages and len(pages) == len(contents):
+                changed = [(r, c) for r, c in zip(pages, contents) if r["content_hash"] != PostedMessageStore.content_hash(c)]
+                pinged = self.posted.pinged(current)
+                new = [uid for uid in learners if pinged is not None and uid not in pinged]
+                try:
+                    # Mentions added by an edit never notify, so the edit pings no one and new learners get a follow-up
+                    await asyncio.gather(*(channel.get_partial_message(r["message_id"]).edit(content=c, allowed_mentions=discord.AllowedMentions.none()) for r, c in changed))
+                    for r, c in changed:
+                        self.posted.set_content(r["message_id"], c)
+                    followups = build_ping_messages(LEARNER_FOLLOWUP_MESSAGE, "**Learners:**", [f"<@{uid}>" for uid in new]) if new else []
+                    for message, content in zip(await send_in_order(channel.send, followups, allowed_mentions=mentions), followups):
+                        self.posted.add("reminder_ping", channel.id, message.id, content)
+                        current.append({"message_id": message.id})
+                    print(f"✅ Learner reminder in #{channel.name} is up to date ({len(changed)} message(s) edited, {len(new)} new learner(s) pinged)")
+                except discord.NotFound:
+                    current = [] # Deleted by someone; post a fresh one
+            else:
+                current = [] # The ping list needs a different number of messages; repost
+            if not current:
+                messages = await send_in_order(channel.send, contents, allowed_mentions=mentions)
+                for message, content in zip(messages, contents):
+                    self.posted.add("reminder", channel.id, message.id, content)
+                print(f"✅ Posted Sanguine Sunday learner reminder in #{channel.name}")
         except Exception as e:
-            print(f"🔥 GSpread error fetching/posting reminder: {e}")
+            print(f"🔥 Error fetching/posting reminder: {e}")
             await channel.send("⚠️ Error processing learner list from database.")
             return False
 
+        # Delete previous reminder messages
+        try:
+            kept = {r["message_id"] for r in current}
+            await self.delete_posted(channel, [r["message_id"] for r in reminders if r["message_id"] not in kept])
+        except Exception as e:
+            print(f"🔥 Error cleaning up reminders: {e}")
+        return True
+
     # --- Slash Commands ---
     
     @app_commands.command(name="sangsignup", description="Manage Sanguine Sunday signups.")
@@ -839,13 +2918,16 @@ class SanguineCog(commands.Cog):
         app_commands.Choice(name="Post Signup Message", value=1),
         app_commands.Choice(name="Post Learner Reminder", value=2),
     ])
+    @instrumented("command")
     async def sangsignup(self, interaction: discord.Interaction, variant: int, channel: Optional[discord.TextChannel] = None):
         target_channel = channel or self.bot.get_channel(SANG_CHANNEL_ID)
         if not target_channel:
             await interaction.response.send_message("⚠️ Could not find the target channel.", ephemeral=True)
+            record_first_response(interaction)
             return
         
         await interaction.response.defer(ephemeral=True)
+        record_first_response(interaction)
         
         if variant == 1:
             await self.post_signup(target_channel)
@@ -859,12 +2941,15 @@ class SanguineCog(commands.Cog):
 
     @app_commands.command(name="sangmatch", description="Create ToB teams from signups in a voice channel.")
     @app_commands.checks.has_role(STAFF_ROLE_ID)
-    @app_commands.describe(voice_channel="Optional: The voice channel to pull users from. If omitted, uses all signups.")
-    async def sangmatch(self, interaction: discord.Interaction, voice_channel: Optional[discord.VoiceChannel] = None):
-        if not self.sang_sheet:
-            await interaction.response.send_message("⚠️ Error: The Sanguine Sunday sheet is not connected.", ephemeral=True)
-            return
+    @app_commands.describe(voice_channel="Optional: The voice channel to pull users from. If omitted, uses all signups.", engine="Optional: Matchmaking engine (defaults to Greedy).", rematch="Optional: Repair the last /sangmatch teams for this channel instead of rebuilding them.", move_players="Optional: Move raiders who are in voice into their team channels.")
+    @app_commands.choices(engine=[
+        app_commands.Choice(name="Greedy (classic)", value="greedy"),
+        app_commands.Choice(name="Optimized (time-budgeted search)", value="optimized"),
+    ])
+    @instrumented("command")
+    async def sangmatch(self, interaction: discord.Interaction, voice_channel: Optional[discord.VoiceChannel] = None, engine: str = "greedy", rematch: bool = False, move_players: bool = False):
         await interaction.response.defer(ephemeral=False)
+        record_first_response(interaction)
         
         vc_member_ids = None 
         channel_name = "All Signups" 
@@ -879,109 +2964,75 @@ class SanguineCog(commands.Cog):
                 return
         
         try:
-            all_signups_records = self.sang_sheet.get_all_records()
-            if not all_signups_records:
+            signup_values = self.store.signup_values()
+            if len(signup_values) <= 1:
                 await interaction.followup.send("⚠️ There are no signups in the database.")
                 return
         except Exception as e:
-            print(f"🔥 GSheet error fetching all signups: {e}")
+            print(f"🔥 Store error fetching all signups: {e}")
             await interaction.followup.send("⚠️ An error occurred fetching signups from the database.")
             return
 
-        available_raiders = []
-        for signup in all_signups_records:
-            user_id = str(signup.get("Discord_ID"))
-            if vc_member_ids and user_id not in vc_member_ids:
-                 continue # User is not in the specified VC
-            
-            roles_str = signup.get("Favorite Roles", "")
-            knows_range, knows_melee = parse_roles(roles_str)
-            kc_raw = signup.get("KC", 0)
-            
-            try:
-                kc_val = int(kc_raw)
-            except (ValueError, TypeError):
-                # Handle "X" KC for mentors or bad data
-                kc_val = 9999 if signup.get("Proficiency", "").lower() == 'mentor' else 0
-            
-            proficiency_val = signup.get("Proficiency", "").lower()
-            
-            # Re-calculate proficiency based on KC, overriding sheet value
-            # (unless they are a mentor)
-            if proficiency_val != 'mentor':
-                if kc_val <= 10: proficiency_val = "new"
-                elif 11 <= kc_val <= 25: proficiency_val = "learner"
-                elif 26 <= kc_val <= 100: proficiency_val = "proficient"
-                else: proficiency_val = "highly proficient"
-
-            available_raiders.append({
-                "user_id": user_id,
-                "user_name": sanitize_nickname(signup.get("Discord_Name")),
-                "proficiency": proficiency_val,
-                "kc": kc_val,
-                "has_scythe": str(signup.get("Has_Scythe", "FALSE")).upper() == "TRUE",
-                "roles_known": roles_str,
-                "learning_freeze": str(signup.get("Learning Freeze", "FALSE")).upper() == "TRUE",
-                "knows_range": knows_range,
-                "knows_melee": knows_melee,
-                "wants_mentor": str(signup.get("Mentor_Request", "FALSE")).upper() == "TRUE"
-            })
+        available_raiders = list(load_roster(signup_values, vc_member_ids).raiders())
 
         if not available_raiders:
             await interaction.followup.send(f"⚠️ None of the users in {voice_channel.mention} have signed up for the event." if voice_channel else "⚠️ No eligible signups.")
             return
 
-        teams, stranded_players = matchmaking_algorithm(available_raiders)
+        moved = None
+        if rematch:
+            previous = self.team_runs.latest("sangmatch", voice_channel.id if voice_channel else None)
+            if previous is None:
+                await interaction.followup.send(f"⚠️ There is no previous /sangmatch run for {channel_name} to repair. Run it once without `rematch`.")
+                return
+            teams, stranded_players, moved = repair_teams(previous["teams"], available_raiders,
+                                                          team_assignment(previous["teams"], previous["run_id"]))
+            params = {"algorithm": "repair", "base_run": previous["run_id"]}
+        else:
+            teams, stranded_players, params = run_matchmaking(available_raiders, engine)
         
         guild = interaction.guild
         category = guild.get_channel(SANG_VC_CATEGORY_ID)
         
-        # Create Voice Channels
+        # Reuse or create one voice channel per team, optionally moving raiders into them
+        team_channels = {}
         if category and hasattr(category, "create_voice_channel"):
-            for i in range(len(teams)):
-                try:
-                    await category.create_voice_channel(name=f"SanguineSunday – Team {i+1}", user_limit=5)
-                except Exception as e:
-                    print(f"Error creating VC: {e}") 
+            team_channels = await self.channels.provision(category, len(teams))
+        moved_count = await self.channels.move_players(guild, teams, team_channels) if move_players and team_channels else None
 
-        post_channel = interaction.channel
-        embed = discord.Embed(title=f"Sanguine Sunday Teams - {channel_name}", description=f"Created {len(teams)} valid team(s) from {len(available_raiders)} available signed-up users.", color=discord.Color.red())
+        description = f"Created {len(teams)} valid team(s) from {len(available_raiders)} available signed-up users."
         if not teams:
-            embed.description = "Could not form any valid teams with the available players."
+            description = "Could not form any valid teams with the available players."
+        elif moved is not None:
+            description = f"Repaired run #{params['base_run']}: moved {len(moved)} player(s) into {len(teams)} team(s) from {len(available_raiders)} available signed-up users. 🔀 marks who moved."
 
-        for i, team in enumerate(teams, start=1):
-            team_sorted = sorted(team, key=prof_rank)
-            team_details = []
-            for p in team_sorted:
-                try:
-                    uid = int(p["user_id"])
-                    member = guild.get_member(uid)
-                    mention = member.mention if member else f"<@{uid}>"
-                except Exception:
-                    mention = f"@{p.get('user_name', 'Unknown')}"
-                
-                role_text = p.get("proficiency", "Unknown").replace(" ", "-").capitalize().replace("-", " ")
-                kc_raw = p.get("kc", 0)
-                kc_text = f"({kc_raw} KC)" if isinstance(kc_raw, int) and kc_raw > 0 and role_text != "Mentor" and kc_raw != 9999 else ""
-                scythe = scythe_icon(p)
-                freeze = freeze_icon(p)
-                team_details.append(f"{mention} • **{role_text}** {kc_text} • {scythe} Scythe {freeze}")
-            
-            embed.add_field(name=f"Team {i} (Size: {len(team)})", value="\n".join(team_details) if team_details else "—", inline=False)
-        
-        global last_generated_teams
-        last_generated_teams = teams
-        await interaction.followup.send(embed=embed)
+        def line_for(p):
+            moved_mark = " 🔀" if moved and str(p.get("user_id")) in moved else ""
+            return format_player_line_mention(guild, p) + moved_mark
+
+        run_id = self.team_runs.save(
+            "sangmatch", channel_name, voice_channel.id if voice_channel else None,
+            params, teams, stranded_players,
+        )
+        team_assignment(teams, run_id) # Indexed now so a rematch of this run only looks up the delta
+        footer = f"Run #{run_id} • /sangexport run_id:{run_id}"
+        if moved_count is not None:
+            footer += f" • Moved {moved_count} raider(s) into team VCs"
+        pages = build_embed_pages(f"Sanguine Sunday Teams - {channel_name}", description, discord.Color.red(), team_fields(teams, line_for), footer)
+        await send_in_order(interaction.followup.send, pages)
 
 
     @app_commands.command(name="sangmatchtest", description="Create ToB teams without pinging or creating voice channels; show plain-text nicknames.")
     @app_commands.checks.has_role(STAFF_ROLE_ID)
-    @app_commands.describe(voice_channel="Optional: The voice channel to pull users from. If omitted, uses all signups.", channel="(Optional) Override the text channel to post teams (testing).")
-    async def sangmatchtest(self, interaction: discord.Interaction, voice_channel: Optional[discord.VoiceChannel] = None, channel: Optional[discord.TextChannel] = None):
-        if not self.sang_sheet:
-            await interaction.response.send_message("⚠️ Error: The Sanguine Sunday sheet is not connected.", ephemeral=True)
-            return
+    @app_commands.describe(voice_channel="Optional: The voice channel to pull users from. If omitted, uses all signups.", channel="(Optional) Override the text channel to post teams (testing).", engine="Optional: Matchmaking engine (defaults to Greedy).")
+    @app_commands.choices(engine=[
+        app_commands.Choice(name="Greedy (classic)", value="greedy"),
+        app_commands.Choice(name="Optimized (time-budgeted search)", value="optimized"),
+    ])
+    @instrumented("command")
+    async def sangmatchtest(self, interaction: discord.Interaction, voice_channel: Optional[discord.VoiceChannel] = None, channel: Optional[discord.TextChannel] = None, engine: str = "greedy"):
         await interaction.response.defer(ephemeral=False)
+        record_first_response(interaction)
 
         vc_member_ids = None
         channel_name = "All Signups"
@@ -996,75 +3047,71 @@ class SanguineCog(commands.Cog):
                 return
 
         try:
-            all_signups_records = self.sang_sheet.get_all_records()
+            signup_values = self.store.signup_values()
         except Exception as e:
             await interaction.followup.send("⚠️ An error occurred fetching signups from the database.")
             return
         
-        available_raiders = []
-        for signup in all_signups_records:
-            user_id = str(signup.get("Discord_ID"))
-            if vc_member_ids and user_id not in vc_member_ids: continue
-            
-            roles_str = signup.get("Favorite Roles", "")
-            knows_range, knows_melee = parse_roles(roles_str)
-            kc_raw = signup.get("KC", 0)
-            try: kc_val = int(kc_raw)
-            except (ValueError, TypeError): kc_val = 9999 if signup.get("Proficiency", "").lower() == 'mentor' else 0
-            
-            proficiency_val = signup.get("Proficiency", "").lower()
-            if proficiency_val != 'mentor':
-                if kc_val <= 10: proficiency_val = "new"
-                elif 11 <= kc_val <= 25: proficiency_val = "learner"
-                elif 26 <= kc_val <= 100: proficiency_val = "proficient"
-                else: proficiency_val = "highly proficient"
-
-            available_raiders.append({
-                "user_id": user_id, "user_name": sanitize_nickname(signup.get("Discord_Name")),
-                "proficiency": proficiency_val, "kc": kc_val,
-                "has_scythe": str(signup.get("Has_Scythe", "FALSE")).upper() == "TRUE",
-                "roles_known": roles_str, "learning_freeze": str(signup.get("Learning Freeze", "FALSE")).upper() == "TRUE",
-                "knows_range": knows_range, "knows_melee": knows_melee,
-                "wants_mentor": str(signup.get("Mentor_Request", "FALSE")).upper() == "TRUE"
-            })
+        available_raiders = list(load_roster(signup_values, vc_member_ids).raiders())
         
         if not available_raiders:
             await interaction.followup.send("⚠️ No eligible signups.")
             return
 
-        teams, stranded_players = matchmaking_algorithm(available_raiders)
+        teams, stranded_players, params = run_matchmaking(available_raiders, engine)
         
         guild = interaction.guild
         post_channel = channel or interaction.channel
-        embed = discord.Embed(title=f"Sanguine Sunday Teams (Test, no pings/VC) - {channel_name}", description=f"Created {len(teams)} valid team(s) from {len(available_raiders)} available signed-up users.", color=discord.Color.dark_gray())
-        
-        for i, team in enumerate(teams, start=1):
-            team_sorted = sorted(team, key=prof_rank)
-            lines = [format_player_line_plain(guild, p) for p in team_sorted]
-            embed.add_field(name=f"Team {i} (Size: {len(team)})", value="\n".join(lines) if lines else "—", inline=False)
-        
-        global last_generated_teams
-        last_generated_teams = teams
+        run_id = self.team_runs.save(
+            "sangmatchtest", channel_name, voice_channel.id if voice_channel else None,
+            params, teams, stranded_players,
+        )
+        pages = build_embed_pages(
+            f"Sanguine Sunday Teams (Test, no pings/VC) - {channel_name}",
+            f"Created {len(teams)} valid team(s) from {len(available_raiders)} available signed-up users.",
+            discord.Color.dark_gray(),
+            team_fields(teams, lambda p: format_player_line_plain(guild, p)),
+            f"Run #{run_id} • /sangexport run_id:{run_id}",
+        )
         
         if interaction.channel == post_channel:
-             await interaction.followup.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+             await send_in_order(interaction.followup.send, pages, allowed_mentions=discord.AllowedMentions.none())
         else:
-             await post_channel.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+             await send_in_order(post_channel.send, pages, allowed_mentions=discord.AllowedMentions.none())
              await interaction.followup.send("✅ Posted no-ping test teams (no voice channels created).", ephemeral=True)
 
 
-    @app_commands.command(name="sangexport", description="Export the most recently generated teams to a text file.")
+    @app_commands.command(name="sangrefresh", description="Re-import signups and History from the Google Sheet into the bot's database.")
+    @app_commands.checks.has_role(STAFF_ROLE_ID)
+    @instrumented("command")
+    async def sangrefresh(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        record_first_response(interaction)
+        if await self.import_from_sheets(priority=PRIORITY_STAFF):
+            message = f"✅ Re-imported {self.store.count(SANG_SHEET_TAB_NAME)} signups and {self.store.count(SANG_HISTORY_TAB_NAME)} History rows."
+            if self.http:
+                stats = self.http.stats()
+                message += f"\nHTTP pool: {stats['requests']} requests over {stats['connections']} connection(s), {stats['token_refreshes']} token refresh(es)."
+            await interaction.followup.send(message, ephemeral=True)
+        else:
+            await interaction.followup.send("⚠️ Could not re-import from the sheet. Check the logs.", ephemeral=True)
+
+    @app_commands.command(name="sangexport", description="Export generated teams to a text file (latest run by default).")
     @app_commands.checks.has_any_role("Administrators", "Clan Staff", "Senior Staff", "Staff", "Trial Staff")
-    async def sangexport(self, interaction: discord.Interaction):
+    @app_commands.describe(run_id="Optional: The run number shown under the teams embed. Defaults to the latest run.")
+    @instrumented("command")
+    async def sangexport(self, interaction: discord.Interaction, run_id: Optional[int] = None):
         await interaction.response.defer(ephemeral=True, thinking=True)
-        global last_generated_teams
-        teams = last_generated_teams
-        if not teams:
-            await interaction.followup.send("⚠️ No teams found from this session.", ephemeral=True)
+        record_first_response(interaction)
+        run = self.team_runs.get(run_id)
+        if not run or not run["teams"]:
+            recent = ", ".join(f"#{r}" for r in self.team_runs.recent_ids()) or "none"
+            missing = f"Run #{run_id} was not found" if run_id is not None else "No teams have been generated yet"
+            await interaction.followup.send(f"⚠️ {missing}. Stored runs: {recent}.", ephemeral=True)
             return
 
-        guild = interaction.guild
-        lines = []
+        teams = run["teams"]
+        lines = [f"Run #{run['run_id']} • {run['command']} • {run['source']} • {run['created_at']}", ""]
         for i, team in enumerate(teams, start=1):
             lines.append(f"Team {i}")
             for p in team:
@@ -1073,6 +3120,11 @@ class SanguineCog(commands.Cog):
                 id_text = str(mid) if mid is not None else "UnknownID"
                 lines.append(f"  - {sname} — ID: {id_text}")
             lines.append("")
+        if run["stranded"]:
+            lines.append("Stranded")
+            for p in run["stranded"]:
+                lines.append(f"  - {sanitize_nickname(p.get('user_name', 'Unknown'))} — ID: {p.get('user_id', 'UnknownID')}")
+            lines.append("")
         txt = "\n".join(lines)
 
         # Try to save to a mounted volume, fallback to /tmp
@@ -1083,8 +3135,8 @@ class SanguineCog(commands.Cog):
             export_dir = Path("/tmp")
             export_dir.mkdir(parents=True, exist_ok=True)
         
-        ts = datetime.now(CST).strftime("%Y%m%d_%H%M%S")
-        outpath = export_dir / f"sanguine_teams_{ts}.txt"
+        ts = datetime.fromisoformat(run["created_at"]).strftime("%Y%m%d_%H%M%S")
+        outpath = export_dir / f"sanguine_teams_run{run['run_id']}_{ts}.txt"
         
         try:
             with open(outpath, "w", encoding="utf-8") as f:
@@ -1097,29 +3149,56 @@ class SanguineCog(commands.Cog):
             await interaction.followup.send(f"⚠️ Failed to write export file: {e}", ephemeral=True)
 
 
-    @app_commands.command(name="sangcleanup", description="Delete auto-created SanguineSunday voice channels from the last run.")
+    @app_commands.command(name="sangcleanup", description="Delete the SanguineSunday team voice channels the bot created.")
     @app_commands.checks.has_any_role("Administrators", "Clan Staff", "Senior Staff", "Staff", "Trial Staff")
+    @instrumented("command")
     async def sangcleanup(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True, thinking=True)
-        guild = interaction.guild
-        category = guild.get_channel(SANG_VC_CATEGORY_ID)
-        if not category:
-            await interaction.followup.send("⚠️ Category not found.", ephemeral=True); return
-        deleted = 0
-        for ch in list(category.channels):
-            try:
-                if isinstance(ch, discord.VoiceChannel) and ch.name.startswith("SanguineSunday – Team "):
-                    await ch.delete(reason="sangcleanup")
-                    deleted += 1
-            except Exception:
-                pass # Ignore errors (e.g., channel deleted by someone else)
-        await interaction.followup.send(f"🧹 Deleted {deleted} voice channels.", ephemeral=True)
+        record_first_response(interaction)
+        deleted, failed, seconds = await self.channels.cleanup(interaction.guild)
+        message = f"🧹 Deleted {deleted} voice channel(s) in {seconds:.2f}s."
+        if failed:
+            message += f" ⚠️ {failed} could not be deleted and stay registered for the next cleanup."
+        await interaction.followup.send(message, ephemeral=True)
+
+    @app_commands.command(name="sangstats", description="Show handler latency, interaction deadline misses and Sheets usage.")
+    @app_commands.checks.has_role(STAFF_ROLE_ID)
+    @instrumented("command")
+    async def sangstats(self, interaction: discord.Interaction):
+        rows = metrics.summary()
+        lines = [f"{'handler':<40}{'calls':>6}{'err':>5}{'p50':>7}{'p99':>7}{'1st99':>7}{'near':>5}{'>3s':>5}"]
+        for r in rows:
+            first = f"{r['first_p99']:.2f}" if r["first_p99"] is not None else "-"
+            label = f"{r['kind']} {r['name']}"[:39]
+            lines.append(f"{label:<40}{r['calls']:>6}{r['errors']:>5}{r['p50']:>7.2f}{r['p99']:>7.2f}{first:>7}{r['near']:>5}{r['misses']:>5}")
+        if not rows:
+            lines.append("No calls recorded yet.")
+        if metrics.recent_near_misses:
+            lines += ["", "Recent near misses:"]
+            for when, kind, name, seconds, auto_deferred in list(metrics.recent_near_misses)[-5:]:
+                lines.append(f"{when:%a %H:%M:%S} {kind} {name} {seconds:.2f}s{' auto-deferred' if auto_deferred else ''}")
+        if self.last_prewarm:
+            when, label, timings = self.last_prewarm
+            steps = ", ".join(f"{k} {v:.2f}s" for k, v in timings.items() if k != "total")
+            lines += ["", f"Last prewarm ({label}, {when:%a %H:%M}): {timings['total']:.2f}s ({steps})"]
+        lines.append("")
+        for name, stats in self.sheets_stats().items():
+            lines.append(f"{name}: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+        # Latencies in seconds; 1st99 = p99 time to first response, near = slow or auto-deferred, >3s = past the deadline
+        pages = [f"```\n{chunk}\n```" for chunk in chunk_lines(lines, MESSAGE_LIMIT - 8)]
+        await interaction.response.send_message(pages[0], ephemeral=True)
+        record_first_response(interaction)
+        for page in pages[1:]:
+            await interaction.followup.send(page, ephemeral=True)
 
     @sangsignup.error
     @sangmatch.error
     @sangmatchtest.error
+    @sangrefresh.error
     @sangexport.error
     @sangcleanup.error
+    @sangstats.error
     async def sang_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
         if isinstance(error, app_commands.MissingRole):
             await interaction.response.send_message("❌ You don't have the required role for this command.", ephemeral=True)
@@ -1129,10 +3208,12 @@ class SanguineCog(commands.Cog):
                 await interaction.followup.send(f"An unexpected error occurred. Please contact staff.", ephemeral=True)
             else:
                 await interaction.response.send_message(f"An unexpected error occurred. Please contact staff.", ephemeral=True)
+                record_first_response(interaction)
 
     # --- Scheduled Tasks ---
 
-    @tasks.loop(time=dt_time(hour=11, minute=0, tzinfo=CST))
+    @tasks.loop(time=SIGNUP_POST_TIME)
+    @instrumented("task")
     async def scheduled_post_signup(self):
         if datetime.now(CST).weekday() == 4:  # 4 = Friday
             print("It's Friday at 11:00 AM CST. Posting Sanguine signup...")
@@ -1142,7 +3223,8 @@ class SanguineCog(commands.Cog):
             else:
                 print(f"🔥 Failed to post signup: Channel {SANG_CHANNEL_ID} not found.")
 
-    @tasks.loop(time=dt_time(hour=14, minute=0, tzinfo=CST))
+    @tasks.loop(time=REMINDER_POST_TIME)
+    @instrumented("task")
     async def scheduled_post_reminder(self):
         if datetime.now(CST).weekday() == 5:  # 5 = Saturday
             print("It's Saturday at 2:00 PM CST. Posting Sanguine learner reminder...")
@@ -1153,22 +3235,75 @@ class SanguineCog(commands.Cog):
                 print(f"🔥 Failed to post reminder: Channel {SANG_CHANNEL_ID} not found.")
 
     @tasks.loop(time=dt_time(hour=4, minute=0, tzinfo=CST)) # 4 AM CST
+    @instrumented("task")
     async def scheduled_clear_sang_sheet(self):
         if datetime.now(CST).weekday() == 0:  # 0 = Monday
             print("MONDAY DETECTED: Clearing SangSignups sheet...")
-            if self.sang_sheet:
-                try:
-                    self.sang_sheet.clear()
-                    self.sang_sheet.append_row(SANG_SHEET_HEADER)
-                    print("✅ SangSignups sheet cleared and headers added.")
-                except Exception as e:
-                    print(f"🔥 Failed to clear SangSignups sheet: {e}")
-            else:
-                print("⚠️ Cannot clear SangSignups sheet, not connected.")
+            try:
+                self.store.clear_signups()
+            except Exception as e:
+                print(f"🔥 Failed to clear local signups: {e}")
+                return
+            await self.replicate_to_sheets()
+
+    @tasks.loop(time=dt_time(hour=3, minute=0, tzinfo=CST)) # 3 AM CST, after Sunday's event
+    @instrumented("task")
+    async def scheduled_cleanup_channels(self):
+        if datetime.now(CST).weekday() == 0:  # 0 = Monday
+            guild = self.bot.get_guild(GUILD_ID)
+            if guild is None:
+                return
+            deleted, failed, seconds = await self.channels.cleanup(guild)
+            print(f"🧹 Post-event cleanup: deleted {deleted} team VC(s) in {seconds:.2f}s, {failed} failed.")
+
+    @tasks.loop(minutes=max(1.0, TOKEN_REFRESH_MARGIN_MINUTES / 2))
+    @instrumented("task")
+    async def scheduled_refresh_token(self):
+        if self.http is None:
+            return
+        try:
+            if await self.sheets.run(self.http.refresh_if_expiring):
+                print(f"✅ Refreshed Sheets token ahead of expiry. HTTP pool: {self.http.stats()}")
+        except Exception as e:
+            print(f"⚠️ Proactive Sheets token refresh failed (the next request will retry): {e}")
+
+    @tasks.loop(time=[at for _, _, at in prewarm_times(PREWARM_MINUTES)])
+    @instrumented("task")
+    async def scheduled_prewarm(self):
+        now = datetime.now(CST)
+        for label, weekday, at in prewarm_times(PREWARM_MINUTES):
+            if now.weekday() == weekday and (now.hour, now.minute) == (at.hour, at.minute):
+                await self.prewarm(label)
+
+    @tasks.loop(seconds=SIGNUP_FLUSH_SECONDS)
+    @instrumented("task")
+    async def scheduled_replicate(self):
+        await self.replicate_to_sheets()
+
+    @tasks.loop(minutes=WITHDRAWAL_COMPACT_MINUTES)
+    @instrumented("task")
+    async def scheduled_compact_withdrawals(self):
+        await self.compact_withdrawals()
+
+    @tasks.loop(minutes=SHEET_IMPORT_MINUTES)
+    @instrumented("task")
+    async def scheduled_import_sheets(self):
+        await self.import_from_sheets()
+
+    @scheduled_import_sheets.before_loop
+    async def before_import_sheets(self):
+        await self.bot.wait_until_ready()
+        # cog_load just bootstrapped the store, so skip the immediate first iteration
+        await asyncio.sleep(SHEET_IMPORT_MINUTES * 60)
 
     @scheduled_post_signup.before_loop
     @scheduled_post_reminder.before_loop
     @scheduled_clear_sang_sheet.before_loop
+    @scheduled_cleanup_channels.before_loop
+    @scheduled_refresh_token.before_loop
+    @scheduled_prewarm.before_loop
+    @scheduled_replicate.before_loop
+    @scheduled_compact_withdrawals.before_loop
     async def before_scheduled_tasks(self):
         await self.bot.wait_until_ready()
 